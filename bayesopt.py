@@ -0,0 +1,271 @@
+import numpy as np
+import cPickle, json
+import os
+import copy
+from executor import get_executor
+from trial_store import TrialStore, template_hash
+from net_compiler import search_domain
+
+
+def normal_cdf(z):
+    """
+        Vectorized standard normal CDF (Abramowitz-Stegun 7.1.26 erf, |error| < 1.5e-7).
+    """
+    x = np.abs(z) / np.sqrt(2.0)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+
+def normal_pdf(z):
+    return np.exp(-0.5 * z * z) / np.sqrt(2.0 * np.pi)
+
+
+class SearchSpace(object):
+    """
+        The HYPERPARAM space (as in config.json) mapped to the unit cube
+    (ENUM options are equal-width bins of their axis).
+    """
+
+    def __init__(self, hyperparam_definitions):
+        self.names = sorted(hyperparam_definitions.keys())
+        self.definitions = dict((name, search_domain(d)) for name, d in hyperparam_definitions.items())
+
+    def decode(self, u):
+        """
+            Unit cube point -> params, in the format used by Spearmint ({name: [value]}).
+        """
+        params = {}
+        for name, value in zip(self.names, u):
+            d = self.definitions[name]
+            if d['type'] == 'INT':
+                params[name] = [int(min(d['min'] + np.floor(value * (d['max'] - d['min'] + 1)), d['max']))]
+            elif d['type'] == 'ENUM':
+                params[name] = [d['options'][int(min(np.floor(value * len(d['options'])), len(d['options']) - 1))]]
+            else:
+                params[name] = [float(d['min'] + value * (d['max'] - d['min']))]
+        return params
+
+    def encode(self, params):
+        u = []
+        for name in self.names:
+            d, value = self.definitions[name], params[name][0]
+            if d['type'] == 'ENUM':
+                u.append((d['options'].index(str(value)) + 0.5) / len(d['options']))
+                continue
+            value = float(value)
+            if d['type'] == 'INT':
+                u.append((value - d['min'] + 0.5) / (d['max'] - d['min'] + 1))
+            else:
+                u.append((value - d['min']) / float(d['max'] - d['min']))
+        return np.array(u)
+
+    def sample(self, n, rng):
+        """
+            n random points of the cube, snapped to the INT/ENUM grid.
+        """
+        return np.array([self.encode(self.decode(u)) for u in rng.uniform(size=(n, len(self.names)))])
+
+
+class GaussianProcess(object):
+    """
+        GP regression with an ARD Matern 5/2 kernel on standardized targets.
+    The length scales and the noise are chosen among random candidates by
+    maximizing the marginal likelihood.
+    """
+
+    def __init__(self, rng, n_candidates=64):
+        self.rng = rng
+        self.n_candidates = n_candidates
+        self.lengthscales, self.noise = None, None
+
+    @staticmethod
+    def kernel(A, B, lengthscales):
+        diff = (A[:, np.newaxis, :] - B[np.newaxis, :, :]) / lengthscales
+        r = np.sqrt(5.0 * np.sum(diff * diff, axis=-1))
+        return (1.0 + r + r * r / 3.0) * np.exp(-r)
+
+    def _factorize(self, X, y, lengthscales, noise):
+        K = self.kernel(X, X, lengthscales) + (noise + 1e-8) * np.eye(len(X))
+        L = np.linalg.cholesky(K)
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+        log_likelihood = -0.5 * y.dot(alpha) - np.sum(np.log(np.diag(L)))
+        return L, alpha, log_likelihood
+
+    def fit(self, X, y, refit=True):
+        self.X = X
+        self.y_mean, self.y_std = np.mean(y), np.std(y) if np.std(y) > 0 else 1.0
+        y = (y - self.y_mean) / self.y_std
+
+        if refit or self.lengthscales is None:
+            d = X.shape[1]
+            candidates = [(np.exp(self.rng.uniform(np.log(0.05), np.log(5.0), d)),
+                           np.exp(self.rng.uniform(np.log(1e-6), np.log(1e-1))))
+                          for _ in range(self.n_candidates)]
+            if self.lengthscales is not None:
+                candidates.append((self.lengthscales, self.noise))
+            best = None
+            for lengthscales, noise in candidates:
+                try:
+                    log_likelihood = self._factorize(X, y, lengthscales, noise)[2]
+                except np.linalg.LinAlgError:
+                    continue
+                if best is None or log_likelihood > best[0]:
+                    best = (log_likelihood, lengthscales, noise)
+            self.lengthscales, self.noise = best[1], best[2]
+
+        self.L, self.alpha, _ = self._factorize(X, y, self.lengthscales, self.noise)
+        return self
+
+    def predict(self, Xs):
+        Ks = self.kernel(self.X, Xs, self.lengthscales)
+        mean = Ks.T.dot(self.alpha)
+        v = np.linalg.solve(self.L, Ks)
+        var = np.maximum(1.0 - np.sum(v * v, axis=0), 1e-12)
+        return self.y_mean + self.y_std * mean, self.y_std * np.sqrt(var)
+
+
+def suggest(space, X, objective, constraint, q, rng, n_candidates=2000):
+    """
+        Constrained expected improvement: EI of the objective times the
+    probability that the constraint (slack) is >= 0, as in Spearmint. A batch
+    of q points is built with the kriging believer heuristic (the GPs are
+    updated with their own predictions at the points already selected).
+
+    :param space: the SearchSpace
+    :param X: the evaluated points (unit cube), (n, d)
+    :param objective: objective values, NaN if unknown (e.g., constraint violated)
+    :param constraint: constraint slack values (None if unconstrained)
+    :param q: number of points to suggest
+    :param rng: numpy RandomState
+    :return: list of q points (unit cube)
+    """
+    X, objective = np.array(X), np.array(objective, dtype=float)
+    constraint = np.array(constraint, dtype=float) if constraint is not None else None
+    objective_gp, constraint_gp = GaussianProcess(rng), GaussianProcess(rng)
+    batch = []
+
+    for i in range(q):
+        finite = ~np.isnan(objective)
+        if finite.sum() < 2 and (constraint is None or len(constraint) < 2):
+            batch.append(space.sample(1, rng)[0])  # not enough data for a model yet
+            continue
+
+        # candidates: random points, plus perturbations of the best feasible points
+        candidates = space.sample(n_candidates, rng)
+        if finite.sum() > 0:
+            best_points = X[finite][np.argsort(objective[finite])[:5]]
+            local = best_points[rng.randint(len(best_points), size=n_candidates // 2)] + \
+                rng.normal(scale=0.05, size=(n_candidates // 2, X.shape[1]))
+            candidates = np.vstack([candidates, [space.encode(space.decode(u)) for u in np.clip(local, 0, 1)]])
+
+        acquisition = np.ones(len(candidates))
+        if finite.sum() >= 2:
+            objective_gp.fit(X[finite], objective[finite], refit=(i == 0))
+            mean, std = objective_gp.predict(candidates)
+            feasible = finite if constraint is None else finite & (constraint >= 0)
+            if feasible.sum() > 0:
+                z = (np.min(objective[feasible]) - mean) / std
+                acquisition = std * (z * normal_cdf(z) + normal_pdf(z))
+        if constraint is not None and len(constraint) >= 2:
+            constraint_gp.fit(X, constraint, refit=(i == 0))
+            mean_c, std_c = constraint_gp.predict(candidates)
+            acquisition = acquisition * normal_cdf(mean_c / std_c)
+
+        x = candidates[np.argmax(acquisition)]
+        batch.append(x)
+
+        # kriging believer: pretend that the point was evaluated at the predicted values
+        fantasy_objective = objective_gp.predict(x[np.newaxis])[0][0] if finite.sum() >= 2 else np.nan
+        X = np.vstack([X, x])
+        objective = np.append(objective, fantasy_objective)
+        if constraint is not None:
+            constraint = np.append(constraint, constraint_gp.predict(x[np.newaxis])[0][0]
+                                   if len(constraint) >= 2 else 0.0)
+
+    return batch
+
+
+def split_result(result, hyperpowerparams):
+    """
+        Objective (NaN if unknown) and constraint slack (None if unconstrained)
+    from the result of keras_run.
+    """
+    if hyperpowerparams['exec_mode'] == 'unconstrained':
+        return float(result), None
+    return float(result[hyperpowerparams['optimize']]), float(result[hyperpowerparams['constraint']])
+
+
+def run_bayesopt(hyperpowerparams, max_trials=100, initial_trials=5, seed=None):
+    """
+        Native constrained Bayesian optimization loop (no Spearmint/MongoDB):
+    q = --workers points are suggested at a time and evaluated in parallel
+    by the executor.
+
+    :param hyperpowerparams: the hyperpower parameters of the experiment
+    :param max_trials: number of trials to evaluate
+    :param initial_trials: random trials before the GP models are used
+    :param seed: seed of the optimizer
+    :return: the best feasible trial
+    """
+    experiment = hyperpowerparams['experiment']
+    constrained = hyperpowerparams['exec_mode'] == 'constrained'
+    q = int(hyperpowerparams.get('workers', 1))
+    rng = np.random.RandomState(seed)
+
+    # keras_run works relative to the Spearmint directory of the experiment
+    cwd = os.getcwd()
+    os.chdir(experiment + '/spearmint')
+    try:
+        space = SearchSpace(cPickle.load(open('../tmp/hyperparam_definitions.pkl', 'rb')))
+        executor = get_executor(hyperpowerparams)
+
+        X, objective, constraint, best = [], [], [], None
+        if hyperpowerparams.get('resume', False):
+            # seed the models with the compatible trials of previous searches (not counted in max_trials)
+            for params, result in TrialStore().compatible(hyperpowerparams, template_hash(), space.names):
+                try:
+                    u = space.encode(dict((p, [params[p]]) for p in params))
+                except ValueError:
+                    continue  # ENUM option pruned from the space
+                if np.all((u >= 0) & (u <= 1)):
+                    value, slack = split_result(result, hyperpowerparams)
+                    X.append(u)
+                    objective.append(value)
+                    constraint.append(slack)
+            print "Warm start from %d previous trials" % len(X)
+            max_trials += len(X)
+
+        while len(X) < max_trials:
+            n = min(q, max_trials - len(X))
+            if len(X) < initial_trials:
+                batch = space.sample(n, rng)
+            else:
+                batch = suggest(space, X, objective, constraint if constrained else None, n, rng)
+
+            # keras_run transforms the params in place, hand over copies
+            trials = [space.decode(u) for u in batch]
+            results = executor.map([(copy.deepcopy(params), None, None) for params in trials])
+            for u, params, (result, hw_metrics) in zip(batch, trials, results):
+                value, slack = split_result(result, hyperpowerparams)
+                X.append(u)
+                objective.append(value)
+                constraint.append(slack)
+
+                record = {'params': params, 'objective': value, 'constraint': slack}
+                with open('../tmp/bayesopt_trials.jsonl', 'a') as f:
+                    f.write(json.dumps(record) + '\n')
+                if not np.isnan(value) and (slack is None or slack >= 0) and \
+                        (best is None or value < best['objective']):
+                    best = record
+                    print "New best (trial %d):" % len(X), best
+                    with open('../tmp/bayesopt_best.json', 'w') as f:
+                        json.dump(best, f)
+
+        executor.close()
+        print "Bayesian optimization done: %d trials" % len(X)
+        print "Best configuration:", best
+        return best
+    finally:
+        os.chdir(cwd)
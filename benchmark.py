@@ -0,0 +1,103 @@
+import numpy as np
+import math, resource, threading
+from timeit import default_timer as timer  # highest resolution wall clock (perf_counter on python 3)
+from cost_model import normal_quantile
+
+
+def process_rss():
+    """
+        Current resident memory (bytes) of the process; the peak so far where
+    /proc is not available.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemoryMonitor(object):
+    """
+        Track the peak resident memory of the process in a background thread.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = process_rss()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, process_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, process_rss())
+
+
+def benchmark_inference(model, x_batch, warmup=10, min_iterations=10, max_iterations=1000,
+                        ci_width=0.05, confidence=0.95):
+    """
+        Measure the inference latency of a Keras model on a fixed batch.
+
+    After `warmup` untimed runs, `model.predict` is timed on the same
+    (pre-allocated) batch until the confidence interval of the mean latency is
+    narrower than `ci_width` (relative to the mean), or `max_iterations` is hit.
+    The memory is sampled during the (untimed) warm-up runs only, from a
+    baseline taken before the first one: the cold runs are those that
+    allocate the inference buffers.
+
+    :param model: the Keras model
+    :param x_batch: the input batch
+    :param warmup: number of untimed runs
+    :param min_iterations: minimum number of timed runs
+    :param max_iterations: maximum number of timed runs
+    :param ci_width: target (relative) width of the confidence interval of the mean
+    :param confidence: confidence level of the interval
+    :return: dict with the statistics (s), the timed intervals [(start, end), ...]
+             and the resident memory (bytes) before and at the peak of the inference
+    """
+    x_batch = np.ascontiguousarray(x_batch)
+    batch_size = len(x_batch)
+    z = normal_quantile(0.5 + confidence / 2.0)
+
+    # (the memory monitor thread would disturb the timed runs)
+    rss_before = process_rss()
+    with PeakMemoryMonitor() as memory:
+        for _ in range(max(warmup, 1)):
+            model.predict(x_batch, batch_size=batch_size, verbose=0)
+
+    intervals, latencies = [], []
+    while len(latencies) < max_iterations:
+        start = timer()
+        model.predict(x_batch, batch_size=batch_size, verbose=0)
+        end = timer()
+        intervals.append((start, end))
+        latencies.append(end - start)
+
+        if len(latencies) >= min_iterations:
+            mean = np.mean(latencies)
+            half_width = z * np.std(latencies, ddof=1) / math.sqrt(len(latencies))
+            if 2.0 * half_width <= ci_width * mean:
+                break
+
+    latencies = np.array(latencies)
+    return {'mean': float(np.mean(latencies)),
+            'std': float(np.std(latencies, ddof=1)) if len(latencies) > 1 else 0.0,
+            'p50': float(np.percentile(latencies, 50)),
+            'p95': float(np.percentile(latencies, 95)),
+            'p99': float(np.percentile(latencies, 99)),
+            'iterations': len(latencies),
+            'intervals': intervals,
+            'rss_before': rss_before,
+            'peak_rss': memory.peak}
@@ -0,0 +1,164 @@
+"""
+    Microbenchmarks of the fixed cost of the search loop itself (everything
+but the actual training/inference work), on a tiny synthetic dataset, a
+trivial network and the replay power backend: no GPU or network needed.
+
+Usage (from the repository root):
+    python benchmarks/harness_overhead.py [--trials 5] [--output harness_bench.json]
+"""
+import numpy as np
+import argparse
+import cPickle, json
+import copy
+import os, sys, shutil
+import platform, tempfile, time
+from timeit import default_timer as timer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+NETWORK_DEF = '''import keras
+from keras.models import Sequential
+from keras.layers import Dense, Flatten
+from dataset_cache import load_cache
+
+batch_size = 64
+num_classes = 10
+(x_train, y_train), (x_test, y_test) = load_cache()
+
+model = Sequential()
+hidden = HYPERPARAM{"type": "INT", "token": "hidden", "transform": "X8", "min": 1, "max": 4}
+lr_val = HYPERPARAM{"type": "INT", "token": "base_lr_base", "transform": "NEGEXP10", "min": 1, "max": 3}
+model.add(Flatten(input_shape=x_train.shape[1:]))
+model.add(Dense(hidden, activation='relu'))
+model.add(Dense(num_classes, activation='softmax'))
+model.compile(loss='categorical_crossentropy', optimizer=keras.optimizers.SGD(lr=lr_val), metrics=['accuracy'])
+'''
+
+
+def mean_ms(fn, repeats):
+    """
+        Mean wall time (ms) of fn() over the given number of runs.
+    """
+    start = timer()
+    for _ in range(repeats):
+        fn()
+    return (timer() - start) * 1000.0 / repeats
+
+
+def setup_experiment(experiment):
+    """
+        Create the synthetic experiment through the regular gener_experiment steps.
+    """
+    import gener_experiment
+    import dataset_cache
+    os.makedirs(experiment + '/keras_model')
+    with open(experiment + '/keras_model/network_def.py', 'w') as f:
+        f.write(NETWORK_DEF)
+
+    sys.argv = ['gener_experiment.py', '--experiment', experiment, '--optimize', 'error',
+                '--constraint', 'power', '--constraint_val', '1e9', '--epochs', '1',
+                '--power_backend', 'replay', '--scheduler', 'bayesopt', '--profile_warmup', '2']
+    args = gener_experiment.parse_arguments()
+    gener_experiment.prepare_exp_dir(args)
+    hyperpowerparams = gener_experiment.hyperpower_params(args)
+    dataset_cache.build_cache(experiment + '/cache/dataset', 'synthetic')
+    gener_experiment.spearmint_params(hyperpowerparams)
+    return hyperpowerparams
+
+
+def run_benchmarks(trials, repeats):
+    import hyperpower
+    import bayesopt
+    import net_compiler
+    from power_sampler import ReplaySampler
+
+    results = {}
+    definitions = hyperpower.load_pickle('../tmp/hyperparam_definitions.pkl')
+    params = {'hidden': [2], 'base_lr_base': [2]}
+
+    # per-trial template work (parameter transforms + static shape check of the compiled template)
+    template = hyperpower.load_template()
+    results['template_generation_ms'] = mean_ms(
+        lambda: template.check_shapes(net_compiler.transform_params(definitions, copy.deepcopy(params))), repeats)
+    results['template_compile_ms'] = mean_ms(
+        lambda: net_compiler.NetworkTemplate(template.source, template.filename), max(repeats // 10, 1))
+
+    # pickle loads done at the start of every trial
+    def load_pickles():
+        for name in ['../tmp/hyperparam_definitions.pkl', '../tmp/hyperpowerparams.pkl']:
+            with open(name, 'rb') as f:
+                cPickle.load(f)
+    results['pickle_load_ms'] = mean_ms(load_pickles, repeats)
+
+    # call of the compiled network builder (data mapping, model build and compile)
+    values = net_compiler.transform_params(definitions, copy.deepcopy(params))
+    results['build_ms'] = mean_ms(lambda: hyperpower.build_keras(template, values), max(repeats // 10, 1))
+
+    # power sampler start/stop and energy integration over 100 inference windows
+    def sampler_cycle():
+        sampler = ReplaySampler()
+        sampler.start()
+        sampler.stop()
+    results['sampler_start_stop_ms'] = mean_ms(sampler_cycle, max(repeats // 10, 1))
+    sampler = ReplaySampler()
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    now = timer()
+    windows = [(now - 0.2 + i * 0.001, now - 0.2 + i * 0.001 + 0.0005) for i in range(100)]
+    results['energy_integration_ms'] = mean_ms(lambda: sampler.energy(windows), repeats)
+
+    # suggestion latency of the built-in optimizer (replaces the Spearmint/MongoDB round-trip)
+    space = bayesopt.SearchSpace(definitions)
+    rng = np.random.RandomState(0)
+    X = space.sample(30, rng)
+    objective, constraint = rng.uniform(size=30), rng.uniform(-1, 1, size=30)
+    results['suggestion_ms'] = mean_ms(lambda: bayesopt.suggest(space, X, objective, constraint, 1, rng),
+                                       max(repeats // 10, 1))
+
+    # end-to-end trials, phases from the telemetry log
+    start = timer()
+    for _ in range(trials):
+        hyperpower.keras_run(copy.deepcopy(params))
+    elapsed = timer() - start
+    from telemetry import load_records
+    records = load_records('../telemetry.jsonl')[-trials:]
+    work = [sum(p['duration'] for p in r['phases'] if p['name'] in ['train', 'evaluate', 'profile'])
+            for r in records]
+    results['profile_s'] = float(np.mean([p['duration'] for r in records for p in r['phases']
+                                          if p['name'] == 'profile']))
+    results['per_trial_overhead_s'] = float(np.mean([r['end'] - r['start'] - w for r, w in zip(records, work)]))
+    results['trials_per_second'] = trials / elapsed
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the fixed per-trial cost of the HyperPower harness.')
+    parser.add_argument('--trials', type=int, default=5, help='End-to-end trials to run')
+    parser.add_argument('--repeats', type=int, default=100, help='Repetitions of the micro-benchmarks')
+    parser.add_argument('--output', type=str, default='harness_bench.json', help='Results file (JSON)')
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    experiment = tempfile.mkdtemp(prefix='hyperpower-bench-')
+    cwd = os.getcwd()
+    try:
+        os.chdir(ROOT)  # gener_experiment copies the modules from the repository root
+        setup_experiment(experiment)
+        os.chdir(experiment + '/spearmint')
+        results = run_benchmarks(args.trials, args.repeats)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(experiment)
+
+    results.update({'timestamp': time.time(), 'python': platform.python_version(),
+                    'host': platform.node(), 'trials': args.trials})
+    for name in sorted(results):
+        print "%-26s %s" % (name, results[name])
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+import numpy as np
+import json, math, os
+
+HW_METRICS = ['runtime', 'power', 'energy', 'memory']
+TRAIN_METRICS = ['train_time', 'train_energy']  # cost of training for the full epoch budget
+
+
+def _prod(shape):
+    return int(np.prod([d for d in shape if d is not None]))
+
+
+def layer_features(model):
+    """
+        Analytical cost of each layer of a built (not necessarily trained)
+    Keras model: floating point operations (per sample), number of parameters
+    and size of the output activations (per sample).
+
+    :param model: the Keras model
+    :return: list of dicts, one per layer
+    """
+    layers = []
+    for layer in model.layers:
+        output_shape = layer.output_shape
+        activations = _prod(output_shape[1:])
+        kind = layer.__class__.__name__
+
+        if kind == 'Conv2D':
+            if getattr(layer, 'data_format', 'channels_last') == 'channels_first':
+                in_channels, spatial = layer.input_shape[1], output_shape[2:]
+            else:
+                in_channels, spatial = layer.input_shape[-1], output_shape[1:-1]
+            kernel = _prod(layer.kernel_size)
+            flops = 2 * kernel * in_channels * layer.filters * _prod(spatial)
+        elif kind == 'Dense':
+            flops = 2 * _prod(layer.input_shape[1:]) * layer.units
+        elif kind in ['MaxPooling2D', 'AveragePooling2D']:
+            flops = activations * _prod(layer.pool_size)
+        else:
+            flops = activations  # element-wise layers (activations, dropout, ...)
+
+        layers.append({'name': layer.name, 'type': kind, 'flops': flops,
+                       'params': int(layer.count_params()), 'activations': activations})
+    return layers
+
+
+def model_features(model):
+    """
+        Architecture features used by the cost predictor (bias term, GFLOPs,
+    millions of parameters, millions of activations, largest activation).
+    """
+    layers = layer_features(model)
+    return [1.0,
+            sum(l['flops'] for l in layers) / 1e9,
+            sum(l['params'] for l in layers) / 1e6,
+            sum(l['activations'] for l in layers) / 1e6,
+            max(l['activations'] for l in layers) / 1e6]
+
+
+def memory_footprint(model, batch_size, bytes_per_value=4):
+    """
+        Analytical inference memory (bytes) of a built Keras model: all the
+    parameters, plus the largest pair of consecutive (input, output)
+    activations of a batch.
+    """
+    layers = layer_features(model)
+    activations = [_prod(model.input_shape[1:])] + [l['activations'] for l in layers]
+    peak = max(activations[i] + activations[i + 1] for i in range(len(layers)))
+    return bytes_per_value * (sum(l['params'] for l in layers) + batch_size * peak)
+
+
+def normal_quantile(confidence):
+    """
+        Inverse of the standard normal CDF (by bisection, numpy/scipy-free).
+    """
+    low, high = -10.0, 10.0
+    for _ in range(100):
+        mid = (low + high) / 2.0
+        if 0.5 * (1.0 + math.erf(mid / math.sqrt(2.0))) < confidence:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2.0
+
+
+class CostPredictor(object):
+    """
+        Online (Bayesian) linear regression of the measured hardware metrics
+    (runtime, power, energy, memory) on the architecture features. It is
+    refit from all the trials profiled so far, which are appended to a
+    JSON-lines file.
+    """
+
+    def __init__(self, path, min_observations=8, alpha=1e-3):
+        self.path = path
+        self.min_observations = min_observations
+        self.alpha = alpha
+
+    def observations(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def add(self, features, metrics):
+        """
+            Store the measured metrics (dict) of a profiled architecture.
+        """
+        record = {'features': list(features)}
+        record.update(dict((m, float(metrics[m])) for m in HW_METRICS if m in metrics))
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def predict(self, features, metric):
+        """
+            Predictive mean and standard deviation of the metric for the given
+        architecture features; (None, None) while there are too few observations.
+        """
+        observations = [o for o in self.observations() if metric in o]
+        if len(observations) < self.min_observations:
+            return None, None
+
+        X = np.array([o['features'] for o in observations])
+        y = np.array([o[metric] for o in observations])
+        x = np.array(features)
+        n, d = X.shape
+
+        # ridge solution (bias term not regularized)
+        penalty = self.alpha * np.eye(d)
+        penalty[0, 0] = 0.0
+        precision = X.T.dot(X) + penalty
+        w = np.linalg.solve(precision, X.T.dot(y))
+
+        # noise variance from the residuals, predictive variance of a new point
+        residuals = y - X.dot(w)
+        noise = residuals.dot(residuals) / max(n - d, 1)
+        variance = noise * (1.0 + x.dot(np.linalg.solve(precision, x)))
+
+        return float(x.dot(w)), float(np.sqrt(max(variance, 1e-12)))
+
+    def violates(self, features, metric, limit, confidence):
+        """
+            True if the metric is predicted to be >= limit with (at least) the
+        given confidence. Also returns the predicted value (None if unknown).
+        """
+        mean, std = self.predict(features, metric)
+        if mean is None:
+            return False, None
+        return (mean - limit) / std > normal_quantile(confidence), mean
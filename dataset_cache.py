@@ -0,0 +1,110 @@
+import numpy as np
+import json, os
+
+DEFAULT_CACHE_DIR = '../cache/dataset'  # relative to the Spearmint working dir
+CACHE_ARRAYS = ['x_train', 'y_train', 'x_test', 'y_test']
+
+# arrays already opened by this process (one mmap per cache dir)
+_opened = {}
+
+
+def _load_raw(dataset):
+    """
+        Load a Keras dataset in its raw (uint8) form.
+
+    :param dataset: name of the dataset (cifar10, cifar100, mnist, synthetic)
+    :return: (x_train, y_train), (x_test, y_test), num_classes
+    """
+    if dataset == 'cifar10':
+        from keras.datasets import cifar10
+        return cifar10.load_data() + (10,)
+    if dataset == 'cifar100':
+        from keras.datasets import cifar100
+        return cifar100.load_data() + (100,)
+    if dataset == 'mnist':
+        from keras.datasets import mnist
+        (x_train, y_train), (x_test, y_test) = mnist.load_data()
+        # add the channel axis, so that the templates can use Conv2D directly
+        return (x_train[..., np.newaxis], y_train), (x_test[..., np.newaxis], y_test), 10
+    if dataset == 'synthetic':
+        # tiny random dataset (8x8 RGB, 10 classes), e.g., to benchmark the harness itself
+        rng = np.random.RandomState(0)
+        x, y = rng.randint(0, 256, size=(640, 8, 8, 3)).astype('uint8'), rng.randint(0, 10, size=(640, 1))
+        return (x[:512], y[:512]), (x[512:], y[512:]), 10
+    raise ValueError("Unknown dataset '%s'" % dataset)
+
+
+def build_cache(cache_dir, dataset='cifar10'):
+    """
+        Preprocess the dataset once and store it as .npy files, so that each
+    trial only has to memory-map it. Images are kept as uint8 (normalization
+    happens per batch) and labels are stored one-hot encoded.
+
+    :param cache_dir: directory where the arrays are stored
+    :param dataset: name of the dataset
+    :return: the cache meta-data
+    """
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    if os.path.exists(meta_file):
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        if meta['dataset'] == dataset:
+            print 'Using cached dataset at %s' % cache_dir
+            return meta
+
+    print 'Building dataset cache at %s ...' % cache_dir
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    (x_train, y_train), (x_test, y_test), num_classes = _load_raw(dataset)
+    one_hot = np.eye(num_classes, dtype='uint8')
+    arrays = {'x_train': x_train.astype('uint8'),
+              'y_train': one_hot[np.asarray(y_train).ravel()],
+              'x_test': x_test.astype('uint8'),
+              'y_test': one_hot[np.asarray(y_test).ravel()]}
+    for name in CACHE_ARRAYS:
+        np.save(os.path.join(cache_dir, name + '.npy'), arrays[name])
+
+    meta = {'dataset': dataset, 'num_classes': num_classes,
+            'input_shape': list(x_train.shape[1:]),
+            'train_samples': int(x_train.shape[0]), 'test_samples': int(x_test.shape[0])}
+    # meta-data is written last, it marks the cache as complete
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f)
+
+    return meta
+
+
+def load_meta(cache_dir=DEFAULT_CACHE_DIR):
+    """
+        Meta-data of the cache (dataset, input shape, ...), None if not built.
+    """
+    meta_file = os.path.join(cache_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file, 'r') as f:
+        return json.load(f)
+
+
+def load_cache(cache_dir=DEFAULT_CACHE_DIR):
+    """
+        Memory-map the cached arrays (read-only). Repeated calls within the
+    same process return the already opened arrays.
+
+    :param cache_dir: directory where the arrays are stored
+    :return: (x_train, y_train), (x_test, y_test)
+    """
+    if cache_dir not in _opened:
+        arrays = [np.load(os.path.join(cache_dir, name + '.npy'), mmap_mode='r') for name in CACHE_ARRAYS]
+        _opened[cache_dir] = (arrays[0], arrays[1]), (arrays[2], arrays[3])
+    return _opened[cache_dir]
+
+
+def normalize(x):
+    """
+        Convert a (batch) slice of uint8 images to float32 in [0, 1];
+    already preprocessed inputs are returned as they are.
+    """
+    if x.dtype == np.uint8:
+        return np.multiply(x, 1.0 / 255, dtype='float32')
+    return x
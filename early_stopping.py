@@ -0,0 +1,149 @@
+import numpy as np
+import json, os
+import keras
+from timeit import default_timer as timer  # same clock as the power sampler
+
+
+def load_curves(path):
+    """
+        Validation accuracy curves of the previous trials of the experiment.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def extrapolate_curve(curve, epochs):
+    """
+        Extrapolate a (validation accuracy) learning curve to the given epoch
+    with a least-squares fit of acc(t) = a + b * log(t). The prediction is
+    clipped to [best accuracy seen so far, 1].
+    """
+    t = np.arange(1, len(curve) + 1)
+    if len(curve) < 2:
+        return float(curve[-1])
+    b, a = np.polyfit(np.log(t), curve, 1)
+    return float(np.clip(a + b * np.log(epochs), max(curve), 1.0))
+
+
+class CurveStopping(keras.callbacks.Callback):
+    """
+        Stop a trial whose validation accuracy is hopeless compared to the
+    previous trials of the experiment. After `min_epochs`, at each epoch t the
+    trial is stopped if (i) its best accuracy is below the median of the
+    running averages (up to t) of the previous curves (median stopping rule)
+    and (ii) its curve, extrapolated to the full budget, does not reach the
+    best final accuracy of the previous complete trials. The extrapolated
+    accuracy is then reported instead of the measured one.
+    """
+
+    def __init__(self, path, epochs, min_epochs=3, min_curves=5):
+        super(CurveStopping, self).__init__()
+        self.path = path
+        self.epochs = epochs
+        self.min_epochs = min_epochs
+        self.min_curves = min_curves
+        self.curve = []
+        self.predicted_accuracy = None  # set if the trial is stopped
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        self.curve.append(float(logs.get('val_acc', logs.get('val_accuracy'))))
+        t = len(self.curve)
+        if t < self.min_epochs or t >= self.epochs:
+            return
+
+        previous = [c['curve'] for c in load_curves(self.path) if len(c['curve']) >= t]
+        if len(previous) < self.min_curves:
+            return
+        median = np.median([np.mean(c[:t]) for c in previous])
+        if max(self.curve) >= median:
+            return
+
+        predicted = extrapolate_curve(self.curve, self.epochs)
+        finals = [c['curve'][-1] for c in load_curves(self.path)
+                  if c['epochs'] == self.epochs and not c['stopped']]
+        if len(finals) > 0 and predicted >= max(finals):
+            return
+
+        print "Early stopping @ epoch %d: val_acc %f < median %f, extrapolated %f" % \
+              (t, self.curve[-1], median, predicted)
+        self.predicted_accuracy = predicted
+        self.model.stop_training = True
+
+    def on_train_end(self, logs=None):
+        # store the curve for the next trials
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'curve': self.curve, 'epochs': self.epochs,
+                                'stopped': self.predicted_accuracy is not None}) + '\n')
+
+
+class TrainingCost(keras.callbacks.Callback):
+    """
+        Measure the wall time and (given a running power sampler) the energy
+    of each training epoch, and extrapolate them to the full budget of
+    `epochs` epochs. If the extrapolated `metric` (train_time or
+    train_energy) reaches `limit`, the trial is stopped right away, i.e.,
+    after its first epoch instead of after `epochs` epochs. The first epoch
+    includes one-time costs (graph set-up, warm-up, mostly in its first
+    batch), so the later epochs are estimated from its other batches.
+    """
+
+    def __init__(self, epochs, sampler=None, metric=None, limit=None):
+        super(TrainingCost, self).__init__()
+        self.epochs = epochs
+        self.sampler = sampler
+        self.metric = metric
+        self.limit = limit
+        self.durations, self.energies = [], []
+        self.steady_duration, self.steady_energy = None, None  # epoch without the one-time costs
+        self.over_budget = False
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = timer()
+        self._batches = 0
+
+    def on_batch_end(self, batch, logs=None):
+        if self._batches == 0:
+            self._first_batch_end = timer()
+        self._batches += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        end = timer()
+        self.durations.append(end - self._start)
+        if self.sampler is not None:
+            # (per epoch, while its samples are still in the ring buffer)
+            self.energies.append(self.sampler.energy([(self._start, end)]))
+        if epoch == 0 and self._batches > 1:
+            # the other batches of the first epoch, scaled to a whole epoch
+            scale = self._batches / (self._batches - 1.0)
+            self.steady_duration = (end - self._first_batch_end) * scale
+            if self.sampler is not None:
+                self.steady_energy = self.sampler.energy([(self._first_batch_end, end)]) * scale
+
+        cost = self.extrapolate()
+        if self.metric is not None and cost[self.metric] >= self.limit:
+            print "Training budget exceeded @ epoch %d: %s %f >= %f" % \
+                  (epoch + 1, self.metric, cost[self.metric], self.limit)
+            self.over_budget = True
+            self.model.stop_training = True
+
+    def extrapolate(self):
+        """
+            Training cost for the full budget: the first epoch (graph set-up,
+        warm-up) as measured, the others at the mean of the later epochs seen
+        so far (if there is no other yet, at the first epoch without its first
+        batch).
+        """
+        def total(values, steady):
+            if len(values) > 1:
+                later = np.mean(values[1:])
+            else:
+                later = steady if steady is not None else values[0]
+            return float(values[0] + max(self.epochs - 1, 0) * later)
+
+        cost = {'train_time': total(self.durations, self.steady_duration)}
+        if len(self.energies) > 0:
+            cost['train_energy'] = total(self.energies, self.steady_energy)
+        return cost
@@ -0,0 +1,99 @@
+import cPickle
+import os, sys, signal
+import socket, struct
+
+SOCKET_FILE = '../tmp/hyperpower.sock'  # relative to the Spearmint working dir
+
+
+def _send(conn, obj):
+    data = cPickle.dumps(obj, 2)
+    conn.sendall(struct.pack('!Q', len(data)) + data)
+
+
+def _recv(conn):
+    def read(n):
+        chunks = []
+        while n > 0:
+            chunk = conn.recv(min(n, 1 << 20))
+            if chunk == '':
+                raise EOFError('Connection closed')
+            chunks.append(chunk)
+            n -= len(chunk)
+        return ''.join(chunks)
+    (length,) = struct.unpack('!Q', read(8))
+    return cPickle.loads(read(length))
+
+
+def serve(path=SOCKET_FILE):
+    """
+        Evaluation daemon: keeps Keras/TensorFlow imported and the dataset
+    mapped, and runs the trials sent by the Spearmint jobs one at a time.
+    The Keras session is cleared after each trial. The socket is removed
+    when the daemon is terminated (SIGTERM).
+    """
+    import hyperpower
+    from keras import backend as K
+    from dataset_cache import load_cache
+
+    load_cache()  # map the dataset once
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(16)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # (through the finally below)
+    print "Evaluation daemon listening on %s" % path
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                job_id, params = _recv(conn)
+                print "Running job %s" % job_id
+                try:
+                    reply = ('ok', hyperpower.keras_run(params))
+                except Exception as e:
+                    reply = ('error', repr(e))
+                K.clear_session()  # do not accumulate graphs/memory across trials
+                _send(conn, reply)
+            except (EOFError, socket.error) as e:
+                print "Lost client: %s" % e
+            finally:
+                conn.close()
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)  # a stale socket would pass for a running daemon
+
+
+def is_listening(path=SOCKET_FILE):
+    """
+        Whether a daemon accepts connections on the socket (a socket file
+    alone may be left over by a daemon that was killed).
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        conn.close()
+
+
+# Thin client: the 'main' called by Spearmint for each job (copied as mainrun.py)
+def main(job_id, params):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(SOCKET_FILE)
+    try:
+        _send(conn, (job_id, params))
+        status, result = _recv(conn)
+    finally:
+        conn.close()
+    if status != 'ok':
+        raise RuntimeError('Job %s failed in the evaluation daemon: %s' % (job_id, result))
+    return result
+
+
+if __name__ == '__main__':
+    serve(*sys.argv[1:])
@@ -0,0 +1,313 @@
+import cPickle, fcntl
+import multiprocessing
+import os, socket, sqlite3
+import subprocess, threading, time
+from trial_store import failed_result
+
+QUEUE_FILE = '../tmp/queue.db'  # relative to the Spearmint working dir
+PROFILE_LOCK = '../tmp/profile-%s.lock' % socket.gethostname()  # per host, its trials share the measured power
+SLOT_LOCK = '../tmp/slot-%s-%d.lock'  # (host, slot)
+LEASE = 120.0  # s without a heartbeat before a running trial is considered lost (its worker died)
+MAX_ATTEMPTS = 2  # runs of a trial whose worker died, before it is reported as failed
+_worker_threads = None  # TF threads of this worker process (if limited)
+_slot_lock = None  # CPU slot held by this process (concurrent Spearmint jobs)
+
+
+def run_trial(task):
+    """
+        Evaluate one trial, task = (params, epochs, hw_metrics) as taken by
+    hyperpower.keras_run. Returns (result, hw_metrics), since the in-place
+    update of hw_metrics does not cross process boundaries.
+    """
+    import hyperpower  # (lazy) the Spearmint jobs only use the queue client
+    if _worker_threads is not None:
+        _new_session(_worker_threads)  # fresh graph for each trial of a long-lived worker
+    params, epochs, hw_metrics = task
+    hw_metrics = dict(hw_metrics or {})
+    result = hyperpower.keras_run(params, epochs, hw_metrics)
+    return result, hw_metrics
+
+
+def _new_session(threads):
+    import tensorflow as tf
+    from keras import backend as K
+    K.clear_session()
+    K.set_session(tf.Session(config=tf.ConfigProto(intra_op_parallelism_threads=threads,
+                                                   inter_op_parallelism_threads=min(threads, 2))))
+
+
+def limit_threads(threads, cpus=None):
+    """
+        Restrict the current (worker) process to `threads` TensorFlow threads
+    and, optionally, pin it to the given CPUs. Must be called before the
+    first Keras model is built in the process.
+    """
+    global _worker_threads
+    _worker_threads = threads
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    _new_session(threads)
+    if cpus is not None:
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        else:
+            devnull = open(os.devnull, 'w')
+            subprocess.call(['taskset', '-pc', ','.join(str(c) for c in cpus), str(os.getpid())],
+                            stdout=devnull, stderr=devnull)
+
+
+def claim_slot(workers):
+    """
+        Take one of the `workers` CPU slots of the host for the lifetime of
+    this process (concurrent Spearmint jobs, which are not started by a
+    pool): the slot index, None if they are all taken.
+    """
+    global _slot_lock
+    for slot in range(workers):
+        f = open(SLOT_LOCK % (socket.gethostname(), slot), 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError:
+            f.close()
+            continue
+        _slot_lock = f  # released when the process exits
+        return slot
+    return None
+
+
+class ProfileLock(object):
+    """
+        Keep the HW profiling of a trial free of the load of the other trials
+    of the host (the power samplers read the whole GPU board/CPU package):
+    training epochs hold the lock shared, profiling holds it exclusively. The
+    lock is taken through a gate, which a waiting profiler holds, so that no
+    new epoch starts before it gets the lock. With path=None (trials not
+    concurrent) it does nothing.
+    """
+
+    def __init__(self, path=PROFILE_LOCK):
+        self.path = path
+        self._lock = None
+
+    def _acquire(self, mode):
+        if self.path is None:
+            return
+        with open(self.path + '.gate', 'a') as gate:
+            fcntl.flock(gate, fcntl.LOCK_EX)
+            self._lock = open(self.path, 'a')
+            fcntl.flock(self._lock, mode)
+
+    def acquire_shared(self):
+        self._acquire(fcntl.LOCK_SH)
+
+    def acquire_exclusive(self):
+        self._acquire(fcntl.LOCK_EX)
+
+    def release(self):
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+
+def get_profile_lock(hyperpowerparams):
+    concurrent = int(hyperpowerparams.get('workers', 1)) > 1 or hyperpowerparams.get('executor', 'local') == 'queue'
+    return ProfileLock(PROFILE_LOCK if concurrent else None)
+
+
+def _init_worker(slots, cpus_per_worker):
+    slot = slots.get()
+    cpus = range(slot * cpus_per_worker, (slot + 1) * cpus_per_worker)
+    limit_threads(cpus_per_worker, cpus)
+
+
+class LocalExecutor(object):
+    """
+        Run the trials on a local pool of worker processes; the CPUs of the host
+    are split evenly among the workers (affinity and TF thread pools).
+    """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self._pool = None
+        if workers > 1:
+            slots = multiprocessing.Queue()
+            for slot in range(workers):
+                slots.put(slot)
+            cpus_per_worker = max(multiprocessing.cpu_count() // workers, 1)
+            self._pool = multiprocessing.Pool(workers, _init_worker, (slots, cpus_per_worker))
+
+    def map(self, tasks):
+        if self._pool is None:
+            return [run_trial(task) for task in tasks]
+        return self._pool.map(run_trial, tasks, chunksize=1)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+
+
+class TrialQueue(object):
+    """
+        Trials shared through a SQLite database in the experiment directory:
+    the driver submits them, workers (possibly on other hosts sharing the
+    experiment directory) claim, run and complete them. A running trial is
+    leased to its worker, which renews the lease with heartbeats: the trial
+    of a worker that died is queued again (or, after MAX_ATTEMPTS runs,
+    marked as lost).
+    """
+
+    def __init__(self, path=QUEUE_FILE, lease=LEASE):
+        self.path = path
+        self.lease = lease
+
+    def _connect(self):
+        # (re-)create the table, the experiment's tmp folder is wiped when a search starts
+        db = sqlite3.connect(self.path, timeout=60.0)
+        db.execute('CREATE TABLE IF NOT EXISTS trials (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                   'task BLOB, status TEXT, worker TEXT, result BLOB, '
+                   'submitted REAL, started REAL, finished REAL, heartbeat REAL, attempts INTEGER DEFAULT 0)')
+        columns = [row[1] for row in db.execute('PRAGMA table_info(trials)')]
+        if 'heartbeat' not in columns:  # queue of a resumed search, created before the leases
+            db.execute('ALTER TABLE trials ADD COLUMN heartbeat REAL')
+            db.execute('ALTER TABLE trials ADD COLUMN attempts INTEGER DEFAULT 0')
+        return db
+
+    def expire_leases(self):
+        """
+            Queue again the running trials whose worker stopped sending
+        heartbeats, or mark them as lost after MAX_ATTEMPTS runs.
+        """
+        expired = time.time() - self.lease
+        with self._connect() as db:
+            db.execute("UPDATE trials SET status = 'lost', finished = ? WHERE status = 'running' AND "
+                       "heartbeat < ? AND attempts >= ?", (time.time(), expired, MAX_ATTEMPTS))
+            db.execute("UPDATE trials SET status = 'pending', worker = NULL WHERE status = 'running' AND "
+                       "heartbeat < ?", (expired,))
+
+    def heartbeat(self, trial_id):
+        with self._connect() as db:
+            db.execute('UPDATE trials SET heartbeat = ? WHERE id = ?', (time.time(), trial_id))
+
+    def submit(self, task):
+        with self._connect() as db:
+            cursor = db.execute('INSERT INTO trials (task, status, submitted) VALUES (?, ?, ?)',
+                                (sqlite3.Binary(cPickle.dumps(task, 2)), 'pending', time.time()))
+            return cursor.lastrowid
+
+    def claim(self, worker):
+        """
+            Atomically take the oldest pending trial: (id, task) or None.
+        """
+        self.expire_leases()
+        db = self._connect()
+        try:
+            db.isolation_level = None
+            db.execute('BEGIN IMMEDIATE')  # write lock, one worker claims at a time
+            row = db.execute("SELECT id, task FROM trials WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+            if row is not None:
+                db.execute("UPDATE trials SET status = 'running', worker = ?, started = ?, heartbeat = ?, "
+                           "attempts = attempts + 1 WHERE id = ?", (worker, time.time(), time.time(), row[0]))
+            db.execute('COMMIT')
+        finally:
+            db.close()
+        if row is None:
+            return None
+        return row[0], cPickle.loads(str(row[1]))
+
+    def complete(self, trial_id, result, status='done'):
+        with self._connect() as db:
+            db.execute('UPDATE trials SET status = ?, result = ?, finished = ? WHERE id = ?',
+                       (status, sqlite3.Binary(cPickle.dumps(result, 2)), time.time(), trial_id))
+
+    def result(self, trial_id):
+        """
+            (status, result) of a trial, result is None until it is finished.
+        """
+        with self._connect() as db:
+            status, result = db.execute('SELECT status, result FROM trials WHERE id = ?', (trial_id,)).fetchone()
+        return status, (cPickle.loads(str(result)) if result is not None else None)
+
+
+class QueueExecutor(object):
+    """
+        Run the trials on the workers attached to the experiment's trial queue.
+    A trial that failed on its worker, or was lost with its workers, is
+    reported with the failure value of the search (given hyperpowerparams,
+    otherwise it raises).
+    """
+
+    def __init__(self, path=QUEUE_FILE, poll_interval=1.0, hyperpowerparams=None):
+        self.queue = TrialQueue(path)
+        self.poll_interval = poll_interval
+        self.hyperpowerparams = hyperpowerparams
+
+    def map(self, tasks):
+        ids = [self.queue.submit(task) for task in tasks]
+        results = {}
+        while len(results) < len(ids):
+            time.sleep(self.poll_interval)
+            self.queue.expire_leases()  # (also when no worker is left to claim trials)
+            for trial_id, task in zip(ids, tasks):
+                if trial_id not in results:
+                    status, result = self.queue.result(trial_id)
+                    if status == 'done':
+                        results[trial_id] = result
+                    elif status in ['failed', 'lost']:
+                        message = 'Trial %d %s: %s' % (trial_id, 'failed on its worker' if status == 'failed'
+                                                       else 'lost (its workers died)', result)
+                        if self.hyperpowerparams is None:
+                            raise RuntimeError(message)
+                        print message
+                        results[trial_id] = (failed_result(self.hyperpowerparams), task[2])
+        return [results[trial_id] for trial_id in ids]
+
+    def close(self):
+        pass
+
+
+def get_executor(hyperpowerparams):
+    if hyperpowerparams.get('simulate', False):
+        from simulator import SimulatedExecutor  # replay of the recorded trials, nothing is run
+        return SimulatedExecutor(hyperpowerparams)
+    if hyperpowerparams.get('executor', 'local') == 'queue':
+        return QueueExecutor(hyperpowerparams=hyperpowerparams)
+    return LocalExecutor(int(hyperpowerparams.get('workers', 1)))
+
+
+def run_worker(path=QUEUE_FILE, threads=None, poll_interval=1.0):
+    """
+        Worker loop: claim trials from the queue and run them, forever.
+    """
+    worker = '%s:%d' % (socket.gethostname(), os.getpid())
+    if threads is not None:
+        limit_threads(threads)
+    queue = TrialQueue(path)
+    print "Worker %s waiting for trials on %s" % (worker, path)
+    while True:
+        claimed = queue.claim(worker)
+        if claimed is None:
+            time.sleep(poll_interval)
+            continue
+        trial_id, task = claimed
+        print "Worker %s running trial %d" % (worker, trial_id)
+        running = threading.Event()
+        running.set()
+        heartbeats = threading.Thread(target=_send_heartbeats, args=(queue, trial_id, running))
+        heartbeats.daemon = True
+        heartbeats.start()
+        try:
+            queue.complete(trial_id, run_trial(task))
+        except Exception as e:
+            queue.complete(trial_id, repr(e), status='failed')
+        finally:
+            running.clear()
+            heartbeats.join()
+
+
+def _send_heartbeats(queue, trial_id, running):
+    # renew the lease of the running trial, 4 times per lease
+    while running.is_set():
+        queue.heartbeat(trial_id)
+        deadline = time.time() + queue.lease / 4.0
+        while running.is_set() and time.time() < deadline:
+            time.sleep(0.5)
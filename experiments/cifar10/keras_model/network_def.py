@@ -1,27 +1,19 @@
 import keras
-from keras.datasets import cifar10
 from keras.models import Sequential
 from keras.layers import Dense, Dropout, Activation, Flatten
 from keras.layers import Conv2D, MaxPooling2D
+from dataset_cache import load_cache
 
 batch_size = 32
 num_classes = 10
 
-# The data, shuffled and split between train and test sets:
-(x_train, y_train), (x_test, y_test) = cifar10.load_data()
+# The data, shuffled and split between train and test sets (memory-mapped uint8
+# arrays from the experiment cache, one-hot labels; normalized per batch):
+(x_train, y_train), (x_test, y_test) = load_cache()
 print 'x_train shape:', x_train.shape
 print x_train.shape[0], 'train samples'
 print x_test.shape[0], 'test samples'
 
-# Convert class vectors to binary class matrices.
-y_train = keras.utils.to_categorical(y_train, num_classes)
-y_test = keras.utils.to_categorical(y_test, num_classes)
-
-x_train = x_train.astype('float32')
-x_test = x_test.astype('float32')
-x_train /= 255
-x_test /= 255
-
 model = Sequential()
 conv1_features = HYPERPARAM{"type": "INT", "token": "conv1_num_output", "transform": "X2", "min": 10, "max": 18}
 conv1_kernel = HYPERPARAM{"type": "INT", "token": "conv1_kernel_size", "transform": "X1", "min": 3, "max": 4}
@@ -1,16 +1,23 @@
 import argparse
 import sys
-import string
-from copy import copy
 import subprocess
+import time
 import os
 import cPickle
 from datetime import datetime
-import re
-import json
+import json, hashlib
+import ast
+import dataset_cache
+import power_sampler
+import net_compiler
 
 SPEARMINT_ROOT = '/home/enyac-awa-r5/research/HyperParameterOptimization/Spearmint-master-repo'  # without the trailing slash
 MONGODB_BIN = '/usr/bin/mongod'
+SIMULATION_SETTINGS = ['optimize', 'constraint', 'constraint_val', 'epochs', 'scheduler', 'max_trials', 'initial_trials',
+                       'min_epochs', 'eta', 'workers', 'surrogate', 'pareto']  # stored with the simulated convergence curves
+PARETO_METRICS = ['runtime', 'power', 'energy', 'memory', 'train_time', 'train_energy']  # traded off against the error
+SPEARMINT_SETTINGS = ['exec_mode', 'optimize', 'constraint', 'constraint_val', 'epochs', 'simulate']  # the values Spearmint models depend on
+SUPPORT_MODULES = ['dataset_cache.py', 'cost_model.py', 'benchmark.py', 'power_sampler.py', 'early_stopping.py', 'executor.py', 'hw_cache.py', 'telemetry.py', 'trial_store.py', 'net_compiler.py', 'bayesopt.py', 'supervisor.py']  # imported by mainrun.py, copied next to it
 
 def parse_arguments():
     """
@@ -18,10 +25,75 @@ def parse_arguments():
     """
     parser = argparse.ArgumentParser(description='Hyper-parameter search with Spearming for a Keras NN model.')
     parser.add_argument('--experiment', type=str, required=True, help='Experiment dir')
-    parser.add_argument('--optimize', type=str, required=True, help='Metric to optimize: error, energy, runtime, power')
-    parser.add_argument('--constraint', type=str, required=False, help='Constraint: error, energy, runtime, power')
+    parser.add_argument('--optimize', type=str, required=False, help='Metric to optimize: error, energy, runtime, power, memory, train_time, train_energy')
+    parser.add_argument('--constraint', type=str, required=False, help='Constraint: error, energy, runtime, power, memory, train_time, train_energy')
     parser.add_argument('--constraint_val', type=str, required=False, help='Constraint value')
     parser.add_argument('--epochs', type=str, required=False, help='Number of Keras training epochs', default='50')
+    parser.add_argument('--dataset', type=str, required=False, help='Dataset to cache: cifar10, cifar100, mnist, synthetic',
+                        default='cifar10')
+    parser.add_argument('--predictor', action='store_true',
+                        help='Reject candidates predicted to violate the HW constraint before profiling them')
+    parser.add_argument('--predictor_confidence', type=str, required=False,
+                        help='Confidence needed to reject a candidate by prediction', default='0.99')
+    parser.add_argument('--predictor_min_trials', type=str, required=False,
+                        help='Profiled trials needed before the predictor is used', default='8')
+    parser.add_argument('--profile_batch', type=str, required=False,
+                        help='Batch size of the inference runtime/power profiling', default='100')
+    parser.add_argument('--profile_warmup', type=str, required=False,
+                        help='Untimed inference runs before profiling', default='10')
+    parser.add_argument('--profile_ci_width', type=str, required=False,
+                        help='Target relative width of the 95%% confidence interval of the runtime', default='0.05')
+    parser.add_argument('--profile_max_iterations', type=str, required=False,
+                        help='Maximum number of timed inference runs', default='1000')
+    parser.add_argument('--power_backend', type=str, required=False, default='nvidia-smi',
+                        help='Power sampler: nvidia-smi (GPU), rapl (CPU package), replay (trace file)')
+    parser.add_argument('--power_trace', type=str, required=False,
+                        help='Power trace (offset_s power_w per line) for the replay backend')
+    parser.add_argument('--early_stopping', action='store_true',
+                        help='Stop trials whose validation accuracy curve is hopeless w.r.t. the previous trials')
+    parser.add_argument('--early_stopping_min_epochs', type=str, required=False,
+                        help='Epochs trained before a trial can be stopped', default='3')
+    parser.add_argument('--early_stopping_min_trials', type=str, required=False,
+                        help='Previous trials needed before stopping any trial', default='5')
+    parser.add_argument('--scheduler', type=str, required=False, default='spearmint',
+                        help='Search driver: spearmint (Bayesian optimization), bayesopt (built-in constrained '
+                             'Bayesian optimization, no Spearmint/MongoDB), hyperband (multi-fidelity)')
+    parser.add_argument('--max_trials', type=str, required=False,
+                        help='Number of trials of the built-in Bayesian optimizer', default='100')
+    parser.add_argument('--initial_trials', type=str, required=False,
+                        help='Random trials before the built-in Bayesian optimizer uses its models', default='5')
+    parser.add_argument('--min_epochs', type=str, required=False,
+                        help='Epochs of the cheapest Hyperband rung', default='1')
+    parser.add_argument('--eta', type=str, required=False,
+                        help='Hyperband promotion ratio (top 1/eta move to an eta times larger budget)', default='3')
+    parser.add_argument('--executor', type=str, required=False, default='local',
+                        help='Where trials run: local (process pool), queue (workers attached to the experiment queue)')
+    parser.add_argument('--workers', type=str, required=False, help='Number of concurrent trials', default='1')
+    parser.add_argument('--trial_timeout', type=str, required=False,
+                        help='Wall-clock budget of a trial (s): a trial still running is killed and reported as failed')
+    parser.add_argument('--trial_memory', type=str, required=False,
+                        help='Memory budget of a trial (MB, resident memory of the trial and its children): a trial '
+                             'exceeding it is killed and reported as failed')
+    parser.add_argument('--worker', action='store_true',
+                        help='Run as a worker of the experiment queue (started by --executor queue)')
+    parser.add_argument('--worker_threads', type=str, required=False, help='TF threads of a queue worker')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Run the Spearmint jobs in a warm evaluation daemon (Keras/TF imported once)')
+    parser.add_argument('--report', action='store_true',
+                        help="Summarize the experiment's telemetry log (phase times, trials/hour, violations) and exit")
+    parser.add_argument('--resume', action='store_true',
+                        help='Keep the state of the previous search and reuse the compatible trials of the '
+                             'experiment (results/trials.jsonl) instead of evaluating them again')
+    parser.add_argument('--simulate', action='store_true',
+                        help='Run the search against the recorded trials of the experiment (results/trials.jsonl) '
+                             'instead of training/profiling, and report its convergence (with --report: compare '
+                             'the simulated searches)')
+    parser.add_argument('--pareto', type=str, required=False,
+                        help='Comma-separated HW metrics (runtime, power, energy, memory, train_time, train_energy) '
+                             'to trade off against the error: a single search for the Pareto front (built-in '
+                             'optimizer, instead of --optimize/--constraint), written to pareto_front.json')
+    parser.add_argument('--surrogate', type=str, default='nearest', choices=['nearest', 'gp'],
+                        help='Simulated objective: nearest recorded trial, or GP fit of the recorded metrics')
     return parser.parse_args()
 
 
@@ -32,10 +104,10 @@ def prepare_exp_dir(args):
     """
 
     # make sure that the experiment subfolders are properly set
-    items_to_create = ['/keras_model', '/mongodb', '/spearmint', '/tmp']
+    items_to_create = ['/keras_model', '/mongodb', '/spearmint', '/tmp', '/cache', '/results']
     for path in items_to_create:
         if not os.path.exists(args.experiment + path):
-            os.mkdir(path)
+            os.mkdir(args.experiment + path)
             print 'Creating %s' % path
 
     # make sure that Spearmint is available
@@ -47,15 +119,22 @@ def prepare_exp_dir(args):
                      SPEARMINT_ROOT + '/spearmint/cleanup.sh',
                      MONGODB_BIN, args.experiment + '/keras_model/network_def.py']
 
+    if args.scheduler != 'spearmint' or args.pareto:  # Spearmint/MongoDB are not used
+        error_msgs, items_required = error_msgs[3:], items_required[3:]
+
     for i, path in enumerate(items_required):
         msg = error_msgs[i]
         if not os.path.exists(path):
             print msg % path
             exit()
 
+    if args.resume:
+        print 'Resuming previous run ...'
+        return
+
     # clean-up previous run
     print 'Cleaning-up previous run ...'
-    if os.path.exists(args.experiment + 'spearmint/config.json'):
+    if args.scheduler == 'spearmint' and not args.pareto and os.path.exists(args.experiment + 'spearmint/config.json'):
         subprocess.call('bash ' + SPEARMINT_ROOT + '/spearmint/cleanup.sh' + ' ' +
                         args.experiment + '/spearmint', shell=True)
     subprocess.call('rm -r ' + args.experiment + '/spearmint/*', shell=True)
@@ -72,11 +151,42 @@ def hyperpower_params(args):
     # store genral parameters for the future use
     hyperpowerparams = {}
     hyperpowerparams['SPEARMINT_ROOT'] = SPEARMINT_ROOT
+    hyperpowerparams['search_id'] = datetime.now().strftime('%Y-%d-%m-%H-%M-%S')  # groups the telemetry records
     hyperpowerparams['optimize'] = args.optimize
     hyperpowerparams['experiment'] = args.experiment
     hyperpowerparams['epochs'] = args.epochs
-
-    if hyperpowerparams['optimize'] == 'error':
+    hyperpowerparams['predictor'] = args.predictor
+    hyperpowerparams['predictor_confidence'] = args.predictor_confidence
+    hyperpowerparams['predictor_min_trials'] = args.predictor_min_trials
+    hyperpowerparams['profile_batch'] = args.profile_batch
+    hyperpowerparams['profile_warmup'] = args.profile_warmup
+    hyperpowerparams['profile_ci_width'] = args.profile_ci_width
+    hyperpowerparams['profile_max_iterations'] = args.profile_max_iterations
+    hyperpowerparams['early_stopping'] = args.early_stopping
+    hyperpowerparams['early_stopping_min_epochs'] = args.early_stopping_min_epochs
+    hyperpowerparams['early_stopping_min_trials'] = args.early_stopping_min_trials
+    hyperpowerparams['resume'] = args.resume
+    hyperpowerparams['simulate'] = args.simulate
+    hyperpowerparams['surrogate'] = args.surrogate
+    hyperpowerparams['daemon'] = args.daemon
+    hyperpowerparams['executor'] = args.executor
+    hyperpowerparams['workers'] = args.workers
+    hyperpowerparams['trial_timeout'] = args.trial_timeout
+    hyperpowerparams['trial_memory'] = args.trial_memory
+    hyperpowerparams['power_backend'] = args.power_backend
+    hyperpowerparams['power_trace'] = os.path.abspath(args.power_trace) if args.power_trace else None
+
+    if args.pareto is not None:
+        # multi-objective: the error and the HW metrics, no constraint
+        metrics = [m.strip() for m in args.pareto.split(',') if m.strip()]
+        if len(metrics) == 0 or any(m not in PARETO_METRICS for m in metrics):
+            print "Error: --pareto takes metrics among %s.. Exiting!!" % ', '.join(PARETO_METRICS)
+            exit()
+        hyperpowerparams['optimize'] = 'error'
+        hyperpowerparams['objectives'] = ['error'] + metrics
+        hyperpowerparams['constraint'] = ''
+        hyperpowerparams['exec_mode'] = 'pareto'
+    elif hyperpowerparams['optimize'] == 'error':
         if args.constraint is not None:
             hyperpowerparams['constraint'] = args.constraint
             hyperpowerparams['exec_mode'] = 'constrained'
@@ -98,16 +208,18 @@ def hyperpower_params(args):
             print "Error: Constraint metric defined, but not --constraint_val value set.. Exiting!!"
             exit()
 
-    # make sure that 'nvidia-smi' is available if selected metric is energy or power
-    if hyperpowerparams['optimize'] in ['energy', 'power'] or hyperpowerparams['constraint'] in ['energy', 'power']:
-        try:
-            devnull = open(os.devnull, 'w')
-            subprocess.call('nvidia-smi', shell=False, stdout=devnull, stderr=devnull)
-        except subprocess.CalledProcessError:
-            print "Errors with nvidia-smi?? Is it properly installed"
-            exit()
-        except OSError:
-            print "Error: nvidia-smi (executable) not found!! Is it installed?? Exiting!!"
+    # the evaluation daemon runs the trials one at a time (a single accept loop)
+    if args.daemon and int(args.workers) > 1:
+        print "Error: --daemon runs one trial at a time, it cannot be used with --workers > 1.. Exiting!!"
+        exit()
+
+    # make sure that the power backend is available if selected metric is energy or power
+    power_metrics = ['energy', 'power', 'train_energy']
+    metrics = [hyperpowerparams['optimize'], hyperpowerparams['constraint']] + hyperpowerparams.get('objectives', [])
+    if not args.simulate and any(m in power_metrics for m in metrics):
+        error_msg = power_sampler.check_backend(args.power_backend, args.power_trace)
+        if error_msg is not None:
+            print "Error: %s Exiting!!" % error_msg
             exit()
 
     # store hyperpower parameters
@@ -117,65 +229,108 @@ def hyperpower_params(args):
     return hyperpowerparams
 
 
-def spearmint_generate_cfg(prefix, hyperpowerparams, net):
+def training_only_params(tree, tokens):
+    """
+        Find the hyper-parameters of the network definition that are only
+    used to set up the training (optimizer, compile, fit), i.e., that do not
+    affect the architecture (and hence the HW metrics).
+
+    :param tree: the compiled network definition (HYPERPARAM{...} as __hyperparams__['token'])
+    :param tokens: the hyper-parameter tokens
+    :return: set of tokens
+    """
+    training_calls = set(['compile', 'fit', 'fit_generator', 'optimizers'])
+    aliases = {}  # variable -> token, e.g., lr_val = HYPERPARAM{...}
+
+    training_targets, used_arch, used_training = set(), set(), set()
+    for statement in tree.body:
+        if isinstance(statement, ast.Assign) and net_compiler.param_reference(statement.value) is not None \
+                and all(isinstance(t, ast.Name) for t in statement.targets):
+            for target in statement.targets:
+                aliases[target.id] = net_compiler.param_reference(statement.value)
+            continue
+
+        nodes = list(ast.walk(statement))
+        loaded = set(n.id for n in nodes if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load))
+        loaded |= set(net_compiler.param_reference(n) for n in nodes) - set([None])
+        called = set(n.attr for n in nodes if isinstance(n, ast.Attribute)) | loaded
+        if len(called & (training_calls | training_targets)) > 0:
+            used_training |= loaded
+            if isinstance(statement, ast.Assign):  # e.g., opt = keras.optimizers.SGD(...)
+                training_targets |= set(n.id for t in statement.targets for n in ast.walk(t)
+                                        if isinstance(n, ast.Name))
+        else:
+            used_arch |= loaded
+
+    training = set()
+    for token in tokens:
+        names = set([token]) | set(name for name in aliases if aliases[name] == token)
+        if len(names & used_training) > 0 and len(names & used_arch) == 0:
+            training.add(token)
+    return training
+
+
+def spearmint_generate_cfg(prefix, hyperpowerparams, template):
     """
-         parse HYPERPARAM tokens in the net definition to create the
-       spearmint config.json with the respective variables defined
+         create the spearmint config.json from the hyper-parameters declared
+       in the (compiled) net definition, after pruning the ranges without any
+       valid architecture
 
     :param prefix:
     :param hyperpowerparams:
-    :param net:
+    :param template: the NetworkTemplate
     :return:
     """
 
     config_buffer = ''  # config str for json file
-    param_cnt = {}  # param cnt
-    tokens = {}  # tokens, as defined by user inside keras_model/network_def.py
-    params = {}  # dict of params
 
     exec_mode = hyperpowerparams['exec_mode']
 
-    # create header
-    if exec_mode == 'unconstrained':
-        config_buffer += '{"language": "PYTHON", "main-file": "mainrun.py", ' \
+    # create header (max-concurrent: number of Spearmint jobs running at once)
+    concurrency = '"max-concurrent": %d, ' % int(hyperpowerparams.get('workers', 1))
+    if exec_mode in ['unconstrained', 'pareto']:  # (the Pareto search does not use Spearmint)
+        config_buffer += '{"language": "PYTHON", "main-file": "mainrun.py", ' + concurrency + \
                        '"experiment-name": "hyperpower-' + prefix + '", "likelihood": "GAUSSIAN", "variables" : {'
     elif exec_mode == 'constrained':
-        config_buffer += '{"language": "PYTHON", "main-file": "mainrun.py", ' \
+        config_buffer += '{"language": "PYTHON", "main-file": "mainrun.py", ' + concurrency + \
                        '"experiment-name": "hyperpower-' + prefix + '", "variables" : {'
     else:
         print "Unknown execution mode selected.. Exiting!"
         exit()
 
-    # parse each token and add it to the Spearmint config file object
-    pattern = re.compile('.*HYPERPARAM.*')
-    matches = re.findall(pattern, net)
-    if len(matches) == 0:
-        print "Error: No hyper-parameters!! Make sure you define them in network_def.txt. Exiting!!"
+    # static shape check over the search space, drop the values without any valid architecture
+    try:
+        params, summary = template.prune()
+    except ValueError as e:
+        print "Error: %s. Exiting!!" % e
         exit()
-
-    for match in matches:
-        (name, param) = match.split('HYPERPARAM')  # extract name and the parameter description
-        param_dict = json.loads(param)
-        token_name = param_dict['token']  # token entry needed (!!), where the hyper-param name is defined
-
-        # make sure you have not seen this name before !!
-        if token_name in params.keys():
-            print "Same token name used in multiple hyper-parameter definitions.. Exiting!!"
-            exit()
-
-        tokens[len(tokens) + 1] = {'name': token_name, 'description': param}  # store the token
-        params[token_name] = param_dict  # store the parsed parameter
-
-        # fill the json file buffer with variable descriptions
-        if param_dict['type'] == 'INT':
+    if summary is None:
+        print 'Search space too large for the static shape check, shapes are checked per trial'
+    else:
+        print 'Static shape check: %d of %d architectures invalid' % (summary['invalid'], summary['checked'])
+        for token in sorted(summary['pruned']):
+            print 'Pruned %s: %s -> %s' % ((token,) + summary['pruned'][token])
+
+    training_params = training_only_params(template.tree, template.tokens)
+    for token_name in template.tokens:
+        param_dict = params[token_name]
+
+        # does it affect the architecture (HW metrics)? either declared ("arch": true/false) or detected
+        if 'arch' not in param_dict:
+            param_dict['arch'] = token_name not in training_params
+        print 'Hyper-parameter %s: %s' % (token_name, 'architecture' if param_dict['arch'] else 'training only')
+
+        # fill the json file buffer with variable descriptions (log scales are searched over the exponent)
+        domain = net_compiler.search_domain(param_dict)
+        if domain['type'] == 'INT':
             config_buffer += '"%s": { "type": "INT", "size": 1, "min": %d, "max": %d},' \
-                             % (token_name, param_dict['min'], param_dict['max'])
-        if param_dict['type'] == 'FLOAT':
+                             % (token_name, domain['min'], domain['max'])
+        if domain['type'] == 'FLOAT':
             config_buffer += '"%s": { "type": "FLOAT", "size": 1, "min": %f, "max": %f},' \
-                             % (token_name, param_dict['min'], param_dict['max'])
-        # if param_dict['type'] == 'ENUM':
-        #     config_buffer += '"%s": { "type": "ENUM", "size": 1, "options" : [%s] },' \
-        #                      % (token_name, ', '.join([str(x) for x in param_dict['options']]))
+                             % (token_name, domain['min'], domain['max'])
+        if domain['type'] == 'ENUM':
+            config_buffer += '"%s": { "type": "ENUM", "size": 1, "options" : %s },' \
+                             % (token_name, json.dumps(domain['options']))
 
     if exec_mode == 'constrained':
         # Make sure you add constraints definition in json
@@ -198,38 +353,127 @@ def spearmint_generate_cfg(prefix, hyperpowerparams, net):
     with open(hyperpowerparams['experiment'] + '/tmp/hyperparam_definitions.pkl', 'wb') as f:
         cPickle.dump(params, f)
 
-    return config_buffer, tokens
+    return config_buffer
 
 def spearmint_params(hyperpowerparams):
 
     netfile = hyperpowerparams['experiment'] + '/keras_model/network_def.py'  # read in Keras definition file
     net = open(netfile, 'r').read()
-    tmp_net = copy(net) # templates for keras net file
     prefix = datetime.now().strftime('%Y-%d-%m-%H-%M-%S') # unique prefix for this run
 
-    # parse HYPERPARAM tokens in the net definition to create Spearmint's config.json
-    config_buffer, tokens = spearmint_generate_cfg(prefix, hyperpowerparams, net)
+    # Spearmint keys its database by the experiment name: keep it to continue the previous search, unless the
+    # objective/constraint values it stored were computed differently (past trials then only come through the
+    # trial store, which re-derives them)
+    settings = dict((k, hyperpowerparams.get(k, None)) for k in SPEARMINT_SETTINGS)
+    settings['network'] = hashlib.sha1(net).hexdigest()
+    config_file = hyperpowerparams['experiment'] + '/spearmint/config.json'
+    settings_file = hyperpowerparams['experiment'] + '/spearmint/search_settings.json'
+    if hyperpowerparams.get('resume', False) and os.path.exists(config_file):
+        previous = None
+        if os.path.exists(settings_file):
+            with open(settings_file, 'r') as f:
+                previous = json.load(f)
+        if previous == settings:
+            with open(config_file, 'r') as f:
+                prefix = json.load(f)['experiment-name'][len('hyperpower-'):]
+            print 'Continuing Spearmint experiment hyperpower-%s' % prefix
+        else:
+            print 'Search settings changed, new Spearmint experiment (past trials are reused from the trial store)'
+    with open(settings_file, 'w') as f:
+        json.dump(settings, f)
+
+    # compile the net definition (HYPERPARAM{...} declarations, Sequential model shapes)
+    try:
+        template = net_compiler.NetworkTemplate(net, netfile, dataset_cache.load_meta(
+            hyperpowerparams['experiment'] + '/cache/dataset'))
+    except (ValueError, SyntaxError) as e:
+        print "Error: %s. Exiting!!" % e
+        exit()
 
-    # move hyperpower function to the experiment directory
-    subprocess.call('cp hyperpower.py %s/spearmint/mainrun.py' % hyperpowerparams['experiment'], shell=True)
+    # create Spearmint's config.json from the hyper-parameters
+    config_buffer = spearmint_generate_cfg(prefix, hyperpowerparams, template)
 
-    # generate keras templates
-    for i in range(1, len(tokens) + 1):
-        # replace HYPERPARAM{...} with HYPERPARAM_name in the template file
-        tmp_net = string.replace(tmp_net, tokens[i]['description'], '_' + tokens[i]['name'], 1)
-    # store template files
+    # move hyperpower function to the experiment directory (or the client of the evaluation daemon)
+    mainrun = 'eval_daemon.py' if hyperpowerparams.get('daemon', False) else 'hyperpower.py'
+    if hyperpowerparams.get('simulate', False):
+        mainrun = 'simulator.py'
+    subprocess.call('cp %s %s/spearmint/mainrun.py' % (mainrun, hyperpowerparams['experiment']), shell=True)
+    for module in SUPPORT_MODULES:
+        subprocess.call('cp %s %s/spearmint/' % (module, hyperpowerparams['experiment']), shell=True)
+
+    # store the template, compiled once by each trial process
     with open(hyperpowerparams['experiment'] + '/tmp/keras_net_template.py', 'w') as f:
-        f.write(tmp_net)
+        f.write(net)
 
 
 def main(args):
 
     args = parse_arguments()  # parse run arguments
+    if args.report and args.simulate:
+        import simulator
+        simulator.compare_simulations(args.experiment + '/results')
+        return
+    if args.report:
+        import telemetry
+        telemetry.report(args.experiment + '/telemetry.jsonl')
+        return
+    if args.worker:
+        # serve the trials queued by the experiment (possibly from another host)
+        import executor
+        os.chdir(args.experiment + '/spearmint')
+        executor.run_worker(threads=int(args.worker_threads) if args.worker_threads else None)
+        return
+    if args.optimize is None and args.pareto is None:
+        print "Error: --optimize (or --pareto) is required.. Exiting!!"
+        exit()
+
     prepare_exp_dir(args)  # make sure everything is in place
     hyperpowerparams = hyperpower_params(args)  # set hyperpower arguments
+    if args.simulate:
+        if not os.path.exists(args.experiment + '/results/trials.jsonl'):
+            print "Error: no recorded trials to simulate (results/trials.jsonl).. Exiting!!"
+            exit()
+    else:
+        dataset_cache.build_cache(args.experiment + '/cache/dataset', args.dataset)  # preprocess the data once
     spearmint_params(hyperpowerparams)  # set spearmint arguments
-    subprocess.call("python %s/spearmint/main.py %s/spearmint" %
-                    (SPEARMINT_ROOT, args.experiment), shell=True)  # start Spearmint
+    if args.pareto:
+        import pareto
+        pareto.run_pareto(hyperpowerparams, int(args.max_trials), int(args.initial_trials))
+    elif args.scheduler == 'hyperband':
+        import hyperband
+        hyperband.run_hyperband(hyperpowerparams, int(args.min_epochs), int(args.eta))
+    elif args.scheduler == 'bayesopt':
+        import bayesopt
+        bayesopt.run_bayesopt(hyperpowerparams, int(args.max_trials), int(args.initial_trials))
+    else:
+        daemon = None
+        if args.daemon and not args.simulate:
+            # warm evaluation daemon, serves the Spearmint jobs over a Unix socket
+            import eval_daemon
+            socket_file = args.experiment + '/tmp/hyperpower.sock'
+            if os.path.exists(socket_file):
+                os.remove(socket_file)  # left over by a previous run (e.g., with --resume)
+            daemon = subprocess.Popen(['python', os.path.abspath('eval_daemon.py')],
+                                      cwd=args.experiment + '/spearmint')
+            while not eval_daemon.is_listening(socket_file):
+                if daemon.poll() is not None:
+                    print "Error: the evaluation daemon did not start.. Exiting!!"
+                    exit()
+                time.sleep(0.5)
+        try:
+            subprocess.call("python %s/spearmint/main.py %s/spearmint" %
+                            (SPEARMINT_ROOT, args.experiment), shell=True)  # start Spearmint
+        finally:
+            if daemon is not None:
+                daemon.terminate()
+                daemon.wait()
+
+    if args.simulate:
+        # convergence of the simulated search (best feasible objective vs simulated GPU-hours)
+        import simulator
+        settings = dict((k, v) for k, v in vars(args).items() if k in SIMULATION_SETTINGS)
+        simulator.report_simulation('%s/results/simulation-%s.jsonl' % (args.experiment, hyperpowerparams['search_id']),
+                                    settings)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,57 @@
+import hashlib, json, os
+import socket
+from net_compiler import plain_value
+
+DEFAULT_CACHE_FILE = '../cache/hw_metrics.jsonl'  # relative to the Spearmint working dir
+
+
+def measurement_setup(hyperpowerparams):
+    """
+        What the measured HW metrics depend on besides the architecture: host,
+    power backend and profiling batch size.
+    """
+    return [socket.gethostname(), hyperpowerparams.get('power_backend', 'nvidia-smi'),
+            str(hyperpowerparams.get('profile_batch', 100))]
+
+
+def architecture_key(template, hyperparam_definitions, params, hyperpowerparams):
+    """
+        Key of the HW metrics of a configuration: hash of the network template,
+    of the (transformed) values of the architectural hyper-parameters only,
+    and of the profiling setup (host, power backend, batch size).
+
+    :param template: the Keras network template
+    :param hyperparam_definitions: the hyper-params definitions ('arch' flags)
+    :param params: the transformed parameter values
+    :param hyperpowerparams: the hyperpower parameters of the experiment
+    :return: hex digest
+    """
+    arch = dict((p, plain_value(params[p][0])) for p in params if hyperparam_definitions[p].get('arch', True))
+    setup = measurement_setup(hyperpowerparams)
+    return hashlib.sha1(template + json.dumps(arch, sort_keys=True) + json.dumps(setup)).hexdigest()
+
+
+class HWMetricCache(object):
+    """
+        Persistent (JSON-lines, append-only) cache of the measured HW metrics,
+    shared by all the trials and searches of the experiment.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        self.path = path
+
+    def get(self, key):
+        if not os.path.exists(self.path):
+            return None
+        metrics = None
+        with open(self.path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if record['key'] == key:
+                        metrics = record['metrics']  # the latest measurement wins
+        return metrics
+
+    def put(self, key, metrics):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'key': key, 'metrics': metrics}) + '\n')
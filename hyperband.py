@@ -0,0 +1,121 @@
+import numpy as np
+import cPickle, json
+import math, os
+import copy
+from executor import get_executor
+from net_compiler import search_domain
+
+
+def sample_params(hyperparam_definitions, rng):
+    """
+        Draw a random instance of the hyper-parameters (in the format used by
+    Spearmint, i.e., {name: [value]}).
+    """
+    params = {}
+    for name, definition in hyperparam_definitions.items():
+        domain = search_domain(definition)
+        if domain['type'] == 'INT':
+            params[name] = [int(rng.randint(domain['min'], domain['max'] + 1))]
+        elif domain['type'] == 'FLOAT':
+            params[name] = [float(rng.uniform(domain['min'], domain['max']))]
+        elif domain['type'] == 'ENUM':
+            params[name] = [domain['options'][rng.randint(len(domain['options']))]]
+    return params
+
+
+def result_score(result, hyperpowerparams, final=True):
+    """
+        Value to minimize from the result of keras_run (inf if infeasible).
+    An error constraint can only be judged at the full budget (final): at a
+    lower fidelity, the configurations are ranked by their error instead.
+    """
+    if hyperpowerparams['exec_mode'] == 'unconstrained':
+        return float(result)
+    constraint = hyperpowerparams['constraint']
+    objective = result[hyperpowerparams['optimize']]
+    if np.isnan(objective):
+        return np.inf
+    if constraint == 'error' and not final:
+        return float(hyperpowerparams['constraint_val']) - result[constraint]  # the low-fidelity error
+    if result[constraint] < 0:
+        return np.inf
+    return float(objective)
+
+
+def hyperband_brackets(max_epochs, min_epochs, eta):
+    """
+        The successive halving brackets of Hyperband: for each bracket a list
+    of rungs (number of configurations, epochs per configuration).
+    """
+    s_max = int(math.floor(math.log(max_epochs / float(min_epochs), eta) + 1e-9))
+    brackets = []
+    for s in range(s_max, -1, -1):
+        n = int(math.ceil((s_max + 1) / float(s + 1) * eta ** s))
+        rungs = []
+        for i in range(s + 1):
+            rungs.append((int(math.floor(n * eta ** -i)),
+                          max(int(round(max_epochs * eta ** (i - s))), min_epochs)))
+        brackets.append(rungs)
+    return brackets
+
+
+def run_hyperband(hyperpowerparams, min_epochs=1, eta=3, seed=None):
+    """
+        Multi-fidelity search: in each bracket, many configurations are trained
+    for a few epochs and only the best 1/eta are promoted to the next (eta
+    times larger) budget. The HW metrics are measured (and the HW constraint
+    checked) once, at the cheapest rung; infeasible configurations are never
+    promoted. An error constraint is only checked at the full budget, the
+    lower rungs promote the configurations with the lowest error.
+
+    :param hyperpowerparams: the hyperpower parameters of the experiment
+    :param min_epochs: epochs of the cheapest rung
+    :param eta: promotion ratio
+    :param seed: seed of the configuration sampler
+    :return: the best result found
+    """
+    experiment = hyperpowerparams['experiment']
+    max_epochs = int(hyperpowerparams['epochs'])
+    rng = np.random.RandomState(seed)
+
+    # keras_run works relative to the Spearmint directory of the experiment
+    cwd = os.getcwd()
+    os.chdir(experiment + '/spearmint')
+    try:
+        with open('../tmp/hyperparam_definitions.pkl', 'rb') as f:
+            hyperparam_definitions = cPickle.load(f)
+        executor = get_executor(hyperpowerparams)  # the rungs are evaluated in parallel
+
+        best, total_epochs = None, 0
+        for b, rungs in enumerate(hyperband_brackets(max_epochs, min_epochs, eta)):
+            configs = [{'params': sample_params(hyperparam_definitions, rng), 'hw_metrics': {}}
+                       for _ in range(rungs[0][0])]
+
+            for i, (n, epochs) in enumerate(rungs):
+                print "Bracket %d, rung %d: %d configurations x %d epochs" % (b, i, len(configs), epochs)
+                # keras_run transforms the params in place, hand over copies
+                tasks = [(copy.deepcopy(c['params']), epochs, c['hw_metrics']) for c in configs]
+                for config, (result, hw_metrics) in zip(configs, executor.map(tasks)):
+                    config['hw_metrics'] = hw_metrics
+                    final = epochs == max_epochs
+                    config['result'], config['score'] = result, result_score(result, hyperpowerparams, final)
+                    total_epochs += epochs if config['score'] < np.inf else 0
+
+                    if final and config['score'] < np.inf and \
+                            (best is None or config['score'] < best['score']):
+                        best = {'params': config['params'], 'result': config['result'], 'score': config['score']}
+                        print "New best:", best
+                        with open('../tmp/hyperband_best.json', 'w') as f:
+                            json.dump(best, f)
+
+                # promote the best (feasible) 1/eta configurations
+                if i + 1 < len(rungs):
+                    configs = [c for c in sorted(configs, key=lambda c: c['score']) if c['score'] < np.inf]
+                    configs = configs[:rungs[i + 1][0]]
+
+        executor.close()
+        print "Hyperband done: %d training epochs in total" % total_epochs
+        print "Best configuration:", best
+        return best
+    finally:
+        os.chdir(cwd)
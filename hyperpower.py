@@ -1,161 +1,460 @@
 import numpy as np
 import cPickle, json
-import math, os, sys
-import string
-import re, time
-import subprocess
+import os, sys
+import time, traceback
 from datetime import datetime
-
-
-def generate_keras_executable(hyperparam_definitions, params, prefix):
+import keras
+from dataset_cache import normalize, load_cache, DEFAULT_CACHE_DIR
+from cost_model import CostPredictor, model_features, memory_footprint, HW_METRICS, TRAIN_METRICS
+from benchmark import benchmark_inference
+from power_sampler import get_sampler
+from early_stopping import CurveStopping, TrainingCost
+from hw_cache import HWMetricCache, architecture_key, measurement_setup
+from telemetry import TrialTelemetry
+from trial_store import TrialStore, template_hash, failed_result
+from net_compiler import NetworkTemplate, transform_params, plain_value
+from supervisor import TrialSupervisor
+from executor import get_profile_lock
+
+_pickles = {}  # pickle files already loaded by this (possibly long-lived) process
+_templates = {}  # network definitions already compiled by this process
+
+
+class TrialError(Exception):
+    """
+        A trial that cannot be evaluated (reported as failed to the optimizer).
     """
-        Generate the Keras executable by replacing the replace hyper-params
-    definitions with their instance values.
 
-    :param hyperparam_definitions: the hyper-params definitios
-    :param params: the (hyper)parameter values for the current
-                   instance suggested by Spearmint
-    :return:
 
-    N.B.: we utilize a syntax similar to the one used in
-    [CWSM](https://github.com/kuz/caffe-with-spearmint)
+def load_pickle(path):
     """
+        Load a pickle file, reusing the object loaded before unless the file
+    has been modified since.
+    """
+    mtime = os.path.getmtime(path)
+    if path not in _pickles or _pickles[path][0] != mtime:
+        with open(path, 'rb') as f:
+            _pickles[path] = (mtime, cPickle.load(f))
+    return _pickles[path][1]
 
-    # transform parameters according to transformation specified in the model file
-    for p in params:
-        if hyperparam_definitions[p].get('transform', None) is not None:
-
-            # X*: multiplier times a number * (e.g., X10, X100, X22)
-            if hyperparam_definitions[p]['transform'][0] == 'X':
-                multiplier = int(hyperparam_definitions[p]['transform'][1:])
-                params[p][0] *= multiplier
 
-            # LOG*: log with base of number
-            if hyperparam_definitions[p]['transform'][0:3] == 'LOG':
-                base = int(hyperparam_definitions[p]['transform'][3:])
-                params[p][0] = math.log(params[p][0], base)
+def load_template(path='../tmp/keras_net_template.py'):
+    """
+        The network definition compiled into a model builder, once per
+    process (again only if the template has been modified since).
+    """
+    mtime = os.path.getmtime(path)
+    if path not in _templates or _templates[path][0] != mtime:
+        _templates[path] = (mtime, NetworkTemplate.load(path, os.path.join(DEFAULT_CACHE_DIR, 'meta.json')))
+    return _templates[path][1]
 
-            # NEGEXP*: negative of exponent (e.g.,: NEGEXP10 of 3 = 10^-3)
-            if hyperparam_definitions[p]['transform'][0:6] == 'NEGEXP':
-                negexp = float(hyperparam_definitions[p]['transform'][6:])
-                params[p] = [negexp ** float(-params[p][0])]
 
-    print params
+def build_keras(template, values):
+    """
+        Run the compiled network definition once: load the data, build and
+    compile the model. The resulting trial is shared by the profiling and
+    the training phases.
 
-    # generate Keras executable file with the current set of paramters
-    tmp_net = open('../tmp/keras_net_template.py', 'r').read()
-    for p in params:
-        tmp_net = string.replace(tmp_net, 'HYPERPARAM_' + p, str(params[p][0]), 1)
-    # store it for future reference
-    with open('../tmp/%s_keras_net.py' % prefix, 'w') as f:
-        f.write(tmp_net)
+    :param template: the compiled network definition (NetworkTemplate)
+    :param values: the (transformed) hyper-parameter values, {name: value}
+    :return: the namespace of the definition (model, x_train, y_train, x_test, y_test, batch_size, ...)
+    """
+    trial = template.build(values)
 
-    return tmp_net
+    for name in ['model', 'x_train', 'y_train', 'x_test', 'y_test', 'batch_size']:
+        if trial.get(name, None) is None:
+            raise TrialError("'%s' is not defined in the Keras network definition" % name)
 
+    return trial
 
-def execute_keras(keras_net, epochs):
 
-    model = None
-    x_train, y_train, batch_size, x_test, y_test = None, None, None, None, None
-    exec keras_net
+class BatchSequence(keras.utils.Sequence):
+    """
+        Stream batches from the (memory-mapped) arrays of the dataset cache
+    and normalize them on the fly, instead of keeping a float32 copy of the
+    whole dataset around. With shuffle, the samples are drawn from a new
+    permutation at each epoch (as model.fit would), sorted within each batch
+    for mostly forward reads of the mapped file; otherwise batches are
+    contiguous.
+    """
 
-    history = model.fit(x_train, y_train, batch_size=batch_size, epochs=epochs,
-                        verbose=0, validation_data=(x_test, y_test))
-    score = model.evaluate(x_test, y_test, verbose=0)
+    def __init__(self, x, y, batch_size, shuffle=False, seed=None):
+        self.x, self.y = x, y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+        self.indices = None
+        self.on_epoch_end()
+
+    def __len__(self):
+        return int(np.ceil(len(self.x) / float(self.batch_size)))
+
+    def __getitem__(self, idx):
+        batch = slice(idx * self.batch_size, (idx + 1) * self.batch_size)
+        if self.indices is not None:
+            batch = np.sort(self.indices[batch])
+        return normalize(self.x[batch]), np.asarray(self.y[batch], dtype='float32')
+
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.indices = self.rng.permutation(len(self.x))
+
+
+def execute_keras(trial, epochs, early_stopping=None, telemetry=None, training_cost=None):
+
+    telemetry = telemetry or TrialTelemetry(None)
+    model, batch_size = trial['model'], trial['batch_size']
+    callbacks = [c for c in [early_stopping, training_cost] if c is not None]
+
+    # no other trial of the host profiles while an epoch runs, nor trains while the energy of an epoch is measured
+    # (the power sampler reads the whole GPU board); first callback to begin, last to end: the wait is not timed
+    lock = get_profile_lock(load_pickle('../tmp/hyperpowerparams.pkl'))
+    if training_cost is not None and training_cost.sampler is not None:
+        acquire = lock.acquire_exclusive
+    else:
+        acquire = lock.acquire_shared
+    callbacks.insert(0, keras.callbacks.LambdaCallback(on_epoch_begin=lambda epoch, logs: acquire()))
+
+    # time each training epoch
+    epoch_start = {}
+    callbacks.append(keras.callbacks.LambdaCallback(
+        on_epoch_begin=lambda epoch, logs: epoch_start.update(time=time.time()),
+        on_epoch_end=lambda epoch, logs: telemetry.add_phase('epoch', epoch_start['time'],
+                                                             time.time() - epoch_start['time'])))
+    callbacks.append(keras.callbacks.LambdaCallback(on_epoch_end=lambda epoch, logs: lock.release()))
+
+    # stream (normalized) batches from the cached arrays
+    train_batches = BatchSequence(trial['x_train'], trial['y_train'], batch_size, shuffle=True)
+    test_batches = BatchSequence(trial['x_test'], trial['y_test'], batch_size)
+    with telemetry.phase('train'):
+        try:
+            if training_cost is not None and training_cost.sampler is not None:
+                training_cost.sampler.start()
+            history = model.fit_generator(train_batches, steps_per_epoch=len(train_batches), epochs=epochs,
+                                          verbose=0, validation_data=test_batches,
+                                          validation_steps=len(test_batches), callbacks=callbacks)
+        finally:
+            lock.release()
+            if training_cost is not None and training_cost.sampler is not None:
+                training_cost.sampler.stop()
+    if training_cost is not None:
+        cost = training_cost.extrapolate()
+        print "Training cost (extrapolated to %d epochs):" % training_cost.epochs, cost
+        telemetry.set(**cost)
+        if training_cost.over_budget:
+            telemetry.set(over_budget=True)
+            return None, None, history  # not trained, no accuracy
+    telemetry.set(curve=[float(acc) for acc in history.history['val_acc']])
+    with telemetry.phase('evaluate'):
+        lock.acquire_shared()
+        try:
+            score = model.evaluate_generator(test_batches, steps=len(test_batches))
+        finally:
+            lock.release()
     print 'Test loss:', score[0]
     print 'Test accuracy:', score[1]
 
-    return float(score[0]), float(score[1]), history
-
-
-def profile_keras(keras_net):
-
-    model = None
-    x_train, y_train, batch_size, x_test, y_test = None, None, None, None, None
-    exec keras_net
-
-    history = model.fit(x_train, y_train, batch_size=batch_size, epochs=1,
-                        verbose=0, validation_data=(x_test, y_test))
+    if early_stopping is not None and early_stopping.predicted_accuracy is not None:
+        # stopped trial: report the accuracy extrapolated to the full budget
+        print 'Extrapolated test accuracy:', early_stopping.predicted_accuracy
+        telemetry.set(early_stopped=True)
+        return float(score[0]), early_stopping.predicted_accuracy, history
 
-    batch_size = 100
-    num_measurements = 30
-    power_measurements = []
-    runtime_measurements = []
-    energy_measurements = []
-    print "Starting nvidia @", datetime.now().strftime('%Y-%d-%m-%H-%M-%S')
-    p = subprocess.Popen(["nvidia-smi", "-i", "0", "-lms", "1", "-q",
-                          "-d", "POWER", "-f", "../tmp/nvidia-smi-log.txt"], shell=False)
-    # iterate multiple times to get a representative value
-    for _ in range(num_measurements):
-
-        start_time_meas = time.time()
-        time.sleep(1)
-        score = model.evaluate(x_test[0:batch_size], y_test[0:batch_size], verbose=0)
-        elapsed_time_meas = time.time() - start_time_meas
-        runtime_measurements.append(elapsed_time_meas)
-
-    p.kill()
-    print "Killing nvidia @", datetime.now().strftime('%Y-%d-%m-%H-%M-%S')
-
-    # parse the output file of nvidia-smi
-    logbuffer = open("../tmp/nvidia-smi-log.txt", 'r').read()
-    pattern = re.compile("Avg\s+: [0-9]+\.[0-9]+ W")  # find optimization tokens in the buffer
-    matches = re.findall(pattern, logbuffer)
-
-    if len(matches) == 0:
-        print "Error: No nvidia-smi values found in log file... Exiting!!"
-        exit()
-
-    # parse each token and add it to the Spearmint config file object
-    values = []
-    for match in matches:
-        val = float(match.split(':')[1].split('W')[0].strip())
-        values.append(val)
+    return float(score[0]), float(score[1]), history
 
-    power = np.mean(values)
-    energy = power * np.mean(runtime_measurements)
 
-    return np.mean(runtime_measurements), power, energy
+def profile_keras(trial, hyperpowerparams, telemetry=None):
+
+    telemetry = telemetry or TrialTelemetry(None)
+    model, x_test = trial['model'], trial['x_test']
+
+    batch_size = int(hyperpowerparams.get('profile_batch', 100))
+    x_batch = normalize(x_test[0:batch_size])
+    # sample the power in the background while the inference is timed
+    sampler = get_sampler(hyperpowerparams.get('power_backend', 'nvidia-smi'),
+                          hyperpowerparams.get('power_trace', None))
+    # concurrent trials of the host: wait until their epochs are done, the sampler reads the whole board/package
+    lock = get_profile_lock(hyperpowerparams)
+    with telemetry.phase('profile_wait'):
+        lock.acquire_exclusive()
+    print "Starting power sampler @", datetime.now().strftime('%Y-%d-%m-%H-%M-%S')
+    try:
+        with telemetry.phase('sampler_start'):
+            sampler.start()
+        # time the inference until the latency estimate is tight enough
+        stats = benchmark_inference(model, x_batch,
+                                    warmup=int(hyperpowerparams.get('profile_warmup', 10)),
+                                    max_iterations=int(hyperpowerparams.get('profile_max_iterations', 1000)),
+                                    ci_width=float(hyperpowerparams.get('profile_ci_width', 0.05)))
+    finally:
+        with telemetry.phase('sampler_stop'):
+            sampler.stop()
+        lock.release()
+        print "Stopping power sampler @", datetime.now().strftime('%Y-%d-%m-%H-%M-%S')
+    print "Runtime (s): mean %f, p50 %f, p95 %f, p99 %f (%d iterations)" % \
+          (stats['mean'], stats['p50'], stats['p95'], stats['p99'], stats['iterations'])
+
+    if len(sampler.samples) == 0:
+        raise TrialError('No power samples collected')
+
+    # power averaged over, and energy (per batch) integrated over, the timed inference windows
+    intervals = stats['intervals']
+    power = sampler.mean_power(intervals)
+    energy = sampler.energy(intervals) / len(intervals)
+
+    # memory (MB): analytical footprint, or the parameters plus the process memory growth during inference
+    analytical = memory_footprint(model, batch_size)
+    measured = 4 * model.count_params() + stats['peak_rss'] - stats['rss_before']
+    memory = max(analytical, measured) / 2.0 ** 20
+    print "Memory (MB): analytical %f, measured %f" % (analytical / 2.0 ** 20, measured / 2.0 ** 20)
+    telemetry.set(memory_analytical=analytical / 2.0 ** 20, memory_measured=measured / 2.0 ** 20)
+
+    return stats['mean'], power, energy, memory
+
+
+def keras_run(params, epochs=None, hw_metrics=None):
+    """
+        Evaluate a hyper-parameter instance (the black-box function of the
+    optimizer). With a per-trial budget (--trial_timeout, --trial_memory),
+    the trial runs in a supervised child process, killed (with its children)
+    when it exceeds the budget, and then reported as failed.
+
+    :param params: the (hyper)parameter values suggested by the optimizer
+    :param epochs: training epochs (by default, the --epochs of the experiment)
+    :param hw_metrics: dict of the HW metrics (runtime, power, energy, memory) of this
+                       configuration; if empty, it is filled in with the
+                       profiled values, otherwise profiling is skipped
+    :return: the objective (and constraint) values
+    """
+    hyperpowerparams = load_pickle('../tmp/hyperpowerparams.pkl')
+    wall_clock, memory = hyperpowerparams.get('trial_timeout', None), hyperpowerparams.get('trial_memory', None)
+    if wall_clock is None and memory is None:
+        return evaluate_trial(params, epochs, hw_metrics)
+
+    import executor  # (the TF threads of this worker, if limited)
+    supervisor = TrialSupervisor(float(wall_clock) if wall_clock is not None else None,
+                                 float(memory) if memory is not None else None)
+    status, result, measured, start = supervisor.run((params, epochs, hw_metrics), __file__, executor._worker_threads)
+    if status == 'done':
+        if hw_metrics is not None:
+            hw_metrics.update(measured)
+        return result
+
+    # killed (or died) without a result, its telemetry is recorded here (from the start of the child)
+    result = failed_result(hyperpowerparams)
+    telemetry = TrialTelemetry(search=hyperpowerparams.get('search_id', None))
+    telemetry.record['start'] = start
+    telemetry.add_phase('supervised', start, time.time() - start)
+    telemetry.set(suggested=param_values(params), constraint=hyperpowerparams.get('constraint', None),
+                  failure=status, result=result)
+    telemetry.write()
+    return result
+
+
+def evaluate_trial(params, epochs=None, hw_metrics=None):
+    """
+        Evaluate a hyper-parameter instance in this process (see keras_run).
+    The phase timings, the parameters and the results of the trial are
+    appended to the experiment's telemetry log. A trial that raises is
+    reported as failed instead of ending the job.
+    """
+    hyperpowerparams = load_pickle('../tmp/hyperpowerparams.pkl')
+    epochs = int(epochs or hyperpowerparams['epochs'])
+    suggested = param_values(params)
+    telemetry = TrialTelemetry(search=hyperpowerparams.get('search_id', None))
+    telemetry.set(suggested=suggested, constraint=hyperpowerparams.get('constraint', None))
+    store, template = TrialStore(), template_hash()
+    try:
+        if hyperpowerparams.get('resume', False):
+            # already evaluated by a previous search (results re-derived for the current constraint)
+            result = store.lookup(hyperpowerparams, template, suggested, epochs)
+            if result is not None:
+                print "Reusing a previous trial:", result
+                telemetry.set(reused=True, result=result)
+                return result
+
+        try:
+            result = run_trial_phases(params, epochs, hw_metrics, telemetry)
+        except Exception as e:
+            # e.g., out of GPU memory: a failed trial, not a failed search
+            traceback.print_exc()
+            result = failed_result(hyperpowerparams)
+            telemetry.set(failure=repr(e), result=result)
+            return result
+        telemetry.set(transformed=param_values(params), result=result)
+
+        # keep the measured metrics for future searches
+        metrics = dict((m, telemetry.record[m]) for m in ['error'] + HW_METRICS + TRAIN_METRICS
+                       if m in telemetry.record)
+        if len(metrics) > 0:
+            store.add(suggested, metrics, epochs, template, hyperpowerparams.get('search_id', None),
+                      telemetry.record.get('early_stopped', False), time.time() - telemetry.record['start'],
+                      telemetry.record.get('curve', None), measurement_setup(hyperpowerparams),
+                      int(hyperpowerparams['epochs']))
+        return result
+    finally:
+        telemetry.write()
+
+
+def param_values(params):
+    """
+        Plain (JSON-serializable) copy of the parameter values.
+    """
+    return dict((p, plain_value(params[p][0])) for p in params)
 
 
-def keras_run(params):
+def run_trial_phases(params, epochs, hw_metrics, telemetry):
 
-    prefix = datetime.now().strftime('%Y-%d-%m-%H-%M-%S')  # unique prefix for this run
     start_time = time.time()
     print "Initial time stamp: ", start_time
 
     # load general and optimization parameters
-    with open('../tmp/hyperparam_definitions.pkl', 'rb') as f:
-        hyperparam_definitions = cPickle.load(f)
-    with open('../tmp/hyperpowerparams.pkl', 'rb') as f:
-        hyperpowerparams = cPickle.load(f)
+    hyperparam_definitions = load_pickle('../tmp/hyperparam_definitions.pkl')
+    hyperpowerparams = load_pickle('../tmp/hyperpowerparams.pkl')
     optimize = hyperpowerparams['optimize']
     experiment = hyperpowerparams['experiment']
-    epochs = int(hyperpowerparams['epochs'])
+    epochs = int(epochs or hyperpowerparams['epochs'])
     exec_mode = hyperpowerparams['exec_mode']
+    telemetry.set(epochs=epochs)
     objective_current_value, constraint_current_value = None, None
     if exec_mode == 'constrained':
         constraint = hyperpowerparams['constraint']
         constraint_val = float(hyperpowerparams['constraint_val'])
 
-    # generate the Keras executable
-    keras_net = generate_keras_executable(hyperparam_definitions, params, prefix)
+    # transform the parameters and check the layer shapes statically, then load the data and build the model
+    # once for all phases
+    with telemetry.phase('generate'):
+        template = load_template()
+        values = transform_params(hyperparam_definitions, params)
+        print params
+        invalid_shape = template.check_shapes(values)
+    if invalid_shape is not None:
+        print "Invalid architecture:", invalid_shape
+        telemetry.set(invalid_shape=invalid_shape)
+        return failed_result(hyperpowerparams)
+    with telemetry.phase('data_load'):
+        if os.path.exists(DEFAULT_CACHE_DIR):
+            load_cache()  # (the network definition gets the already mapped arrays)
+    with telemetry.phase('build'):
+        trial = build_keras(template, values)
+    early_stopping = None
+    if hyperpowerparams.get('early_stopping', False):
+        early_stopping = CurveStopping('../tmp/learning_curves.jsonl', epochs,
+                                       int(hyperpowerparams['early_stopping_min_epochs']),
+                                       int(hyperpowerparams['early_stopping_min_trials']))
 
     if exec_mode == 'unconstrained':
         # Train model to obtain accuracy
-        loss, accuracy, history = execute_keras(keras_net, epochs)
+        loss, accuracy, history = execute_keras(trial, epochs, early_stopping, telemetry)
         print "Loss", loss, "\nAccuracy", accuracy, "\nHistory", history.history['val_acc']
         accuracy_100 = accuracy * 100.0
         error = 100.0 - float(accuracy_100)  # compute the error that you want to minimize
+        telemetry.set(error=error)
         elapsed_time = time.time() - start_time
         print "Elapsed time (s): ", elapsed_time
         return error
 
     elif exec_mode == 'constrained':
 
-        # in constrained case you always have a HW metric, cheaper to evaluate first
-        runtime, power, energy = profile_keras(keras_net)
-        print runtime, power, energy
+        # memory has an analytical lower bound (parameters + peak activations), check it before anything else
+        if optimize == 'error' and constraint == 'memory':
+            analytical_memory = memory_footprint(trial['model'], int(hyperpowerparams.get('profile_batch', 100)))
+            analytical_memory /= 2.0 ** 20
+            if analytical_memory >= constraint_val:
+                print "Analytical memory (MB)", analytical_memory, "(constraint", constraint_val, ")"
+                elapsed_time = time.time() - start_time
+                print "Elapsed time (s): ", elapsed_time
+                return {
+                    optimize: np.NaN,
+                    constraint: constraint_val - analytical_memory
+                }
+
+        # training cost: measured (per epoch) while training, no inference profiling needed
+        if optimize in TRAIN_METRICS or constraint in TRAIN_METRICS:
+            sampler = None
+            if 'train_energy' in [optimize, constraint]:
+                sampler = get_sampler(hyperpowerparams.get('power_backend', 'nvidia-smi'),
+                                      hyperpowerparams.get('power_trace', None), interval=0.05)
+            # extrapolated to the full budget (also for the shorter trials of Hyperband)
+            training_cost = TrainingCost(int(hyperpowerparams['epochs']), sampler,
+                                         constraint if optimize == 'error' else None, constraint_val)
+            loss, accuracy, history = execute_keras(trial, epochs, early_stopping, telemetry, training_cost)
+            cost = training_cost.extrapolate()
+
+            if optimize == 'error':
+                constraint_current_value = cost[constraint]
+                if training_cost.over_budget:
+                    # training budget blown (after the first epoch), return NaN for objective
+                    elapsed_time = time.time() - start_time
+                    print "Elapsed time (s): ", elapsed_time
+                    return {
+                        optimize: np.NaN,
+                        constraint: constraint_val - constraint_current_value
+                    }
+                print "Loss", loss, "\nAccuracy", accuracy, "\nHistory", history.history['val_acc']
+                accuracy_100 = accuracy * 100.0
+                error = 100.0 - float(accuracy_100)  # compute the error that you want to minimize
+                telemetry.set(error=error)
+                elapsed_time = time.time() - start_time
+                print "Elapsed time (s): ", elapsed_time
+                return {
+                    optimize: error,
+                    constraint: constraint_val - constraint_current_value
+                }
+
+            objective_current_value = cost[optimize]
+            print "Loss", loss, "\nAccuracy", accuracy, "\nHistory", history.history['val_acc']
+            accuracy_100 = accuracy * 100.0
+            error = 100.0 - float(accuracy_100)  # compute the error that you want to minimize
+            telemetry.set(error=error)
+            constraint_current_value = error
+            elapsed_time = time.time() - start_time
+            print "Elapsed time (s): ", elapsed_time
+            return {
+                optimize: objective_current_value,
+                constraint: constraint_val - constraint_current_value
+            }
+
+        # HW metrics depend on the architecture only, reuse them if it was profiled before
+        hw_cache = HWMetricCache()
+        arch_key = architecture_key(template.source, hyperparam_definitions, params, hyperpowerparams)
+        cached_metrics = hw_cache.get(arch_key)
+
+        if hw_metrics is not None and 'memory' in hw_metrics:
+            # HW metrics already measured for this configuration (e.g., at a lower fidelity)
+            runtime, power, energy, memory = [hw_metrics[m] for m in HW_METRICS]
+        elif cached_metrics is not None and 'memory' in cached_metrics:
+            print "Cached HW metrics for architecture", arch_key
+            runtime, power, energy, memory = [cached_metrics[m] for m in HW_METRICS]
+        else:
+            # predict the HW constraint from the architecture, before spending time on profiling
+            features = model_features(trial['model'])
+            predictor = CostPredictor('../tmp/hw_observations.jsonl',
+                                      int(hyperpowerparams.get('predictor_min_trials', 8)))
+            if optimize == 'error' and hyperpowerparams.get('predictor', False):
+                with telemetry.phase('predict'):
+                    violated, predicted_value = predictor.violates(features, constraint, constraint_val,
+                                                                   float(hyperpowerparams['predictor_confidence']))
+                if violated:
+                    # HW constraint (confidently) predicted to be violated, skip profiling and training
+                    print "Predicted", constraint, predicted_value, "(constraint", constraint_val, ")"
+                    elapsed_time = time.time() - start_time
+                    print "Elapsed time (s): ", elapsed_time
+                    return {
+                        optimize: np.NaN,
+                        constraint: constraint_val - predicted_value
+                    }
+
+            # in constrained case you always have a HW metric, cheaper to evaluate first
+            with telemetry.phase('profile'):
+                runtime, power, energy, memory = profile_keras(trial, hyperpowerparams, telemetry)
+            print runtime, power, energy, memory
+            measured = dict(zip(HW_METRICS, [runtime, power, energy, memory]))
+            predictor.add(features, measured)
+            hw_cache.put(arch_key, measured)
+        if hw_metrics is not None:
+            hw_metrics.update(dict(zip(HW_METRICS, [runtime, power, energy, memory])))
+        telemetry.set(runtime=runtime, power=power, energy=energy, memory=memory)
 
         # check if the HW constraint is satisfied, otherwise exit
         if optimize == 'error':
@@ -166,6 +465,8 @@ def keras_run(params):
                 constraint_current_value = power
             if constraint == 'runtime':
                 constraint_current_value = runtime
+            if constraint == 'memory':
+                constraint_current_value = memory
 
             if constraint_current_value >= constraint_val:
                 # HW constraint violated, return NaN for objective (max accuracy)
@@ -177,10 +478,11 @@ def keras_run(params):
                 }
             else:
                 # HW constraint satisfied, train model evaluate accuracy
-                loss, accuracy, history = execute_keras(keras_net, epochs)
+                loss, accuracy, history = execute_keras(trial, epochs, early_stopping, telemetry)
                 print "Loss", loss, "\nAccuracy", accuracy, "\nHistory", history.history['val_acc']
                 accuracy_100 = accuracy * 100.0
                 error = 100.0 - float(accuracy_100)  # compute the error that you want to minimize
+                telemetry.set(error=error)
                 elapsed_time = time.time() - start_time
                 print "Elapsed time (s): ", elapsed_time
                 return {
@@ -197,12 +499,15 @@ def keras_run(params):
                 objective_current_value = power
             if optimize == 'runtime':
                 objective_current_value = runtime
+            if optimize == 'memory':
+                objective_current_value = memory
 
             # HW objective computed, train model evaluate accuracy
-            loss, accuracy, history = execute_keras(keras_net, epochs)
+            loss, accuracy, history = execute_keras(trial, epochs, early_stopping, telemetry)
             print "Loss", loss, "\nAccuracy", accuracy, "\nHistory", history.history['val_acc']
             accuracy_100 = accuracy * 100.0
             error = 100.0 - float(accuracy_100)  # compute the error that you want to minimize
+            telemetry.set(error=error)
             constraint_current_value = error
             elapsed_time = time.time() - start_time
             print "Elapsed time (s): ", elapsed_time
@@ -211,7 +516,65 @@ def keras_run(params):
                 constraint: constraint_val - constraint_current_value
             }
 
+    elif exec_mode == 'pareto':
+
+        # all the objectives of the trade-off are measured: HW metrics first (cached or profiled), then training
+        objectives = hyperpowerparams['objectives']
+        measured = {}
+        if any(m in HW_METRICS for m in objectives):
+            hw_cache = HWMetricCache()
+            arch_key = architecture_key(template.source, hyperparam_definitions, params, hyperpowerparams)
+            cached_metrics = hw_cache.get(arch_key)
+            if hw_metrics is not None and 'memory' in hw_metrics:
+                measured = dict((m, hw_metrics[m]) for m in HW_METRICS)
+            elif cached_metrics is not None and 'memory' in cached_metrics:
+                print "Cached HW metrics for architecture", arch_key
+                measured = dict((m, cached_metrics[m]) for m in HW_METRICS)
+            else:
+                with telemetry.phase('profile'):
+                    measured = dict(zip(HW_METRICS, profile_keras(trial, hyperpowerparams, telemetry)))
+                CostPredictor('../tmp/hw_observations.jsonl').add(model_features(trial['model']), measured)
+                hw_cache.put(arch_key, measured)
+            if hw_metrics is not None:
+                hw_metrics.update(measured)
+            telemetry.set(**measured)
+
+        training_cost = None
+        if any(m in TRAIN_METRICS for m in objectives):
+            sampler = None
+            if 'train_energy' in objectives:
+                sampler = get_sampler(hyperpowerparams.get('power_backend', 'nvidia-smi'),
+                                      hyperpowerparams.get('power_trace', None), interval=0.05)
+            training_cost = TrainingCost(int(hyperpowerparams['epochs']), sampler)
+        loss, accuracy, history = execute_keras(trial, epochs, early_stopping, telemetry, training_cost)
+        if training_cost is not None:
+            measured.update(training_cost.extrapolate())
+        print "Loss", loss, "\nAccuracy", accuracy, "\nHistory", history.history['val_acc']
+        accuracy_100 = accuracy * 100.0
+        error = 100.0 - float(accuracy_100)  # compute the error that you want to minimize
+        telemetry.set(error=error)
+        measured['error'] = error
+        elapsed_time = time.time() - start_time
+        print "Elapsed time (s): ", elapsed_time
+        return dict((m, measured[m]) for m in objectives)
+
 
 # Write a function like this called 'main'
 def main(job_id, params):
+    hyperpowerparams = load_pickle('../tmp/hyperpowerparams.pkl')
+
+    if hyperpowerparams.get('executor', 'local') == 'queue':
+        # thin client, the trial is run by one of the workers of the experiment queue
+        from executor import QueueExecutor
+        return QueueExecutor(hyperpowerparams=hyperpowerparams).map([(params, None, None)])[0][0]
+
+    workers = int(hyperpowerparams.get('workers', 1))
+    if workers > 1:
+        # concurrent Spearmint jobs share the host: one CPU slot each, as the workers of the local executor
+        from executor import limit_threads, claim_slot
+        import multiprocessing
+        cpus_per_worker = max(multiprocessing.cpu_count() // workers, 1)
+        slot = claim_slot(workers)
+        cpus = range(slot * cpus_per_worker, (slot + 1) * cpus_per_worker) if slot is not None else None
+        limit_threads(cpus_per_worker, cpus)
     return keras_run(params)
\ No newline at end of file
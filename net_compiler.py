@@ -0,0 +1,637 @@
+import ast, json, math, re
+import itertools, numbers, operator
+import os
+
+PARAMS_NAME = '__hyperparams__'  # argument of the compiled builder, {token: value}
+BUILDER_NAME = 'build_network'
+DECLARATION = re.compile(r'HYPERPARAM\s*{')
+TYPES = ['INT', 'FLOAT', 'ENUM']
+
+
+def plain_value(value):
+    """
+        JSON-serializable version of a parameter value (numbers as float,
+    ENUM options as they are).
+    """
+    return float(value) if isinstance(value, numbers.Number) else value
+
+
+def check_definition(definition, line):
+    """
+        Make sure that a HYPERPARAM{...} declaration is complete.
+    """
+    where = 'HYPERPARAM declaration at line %d' % line
+    if 'token' not in definition:
+        raise ValueError('%s: "token" is missing' % where)
+    if definition.get('type', None) not in TYPES:
+        raise ValueError('%s: "type" must be one of %s' % (where, ', '.join(TYPES)))
+    if definition['type'] == 'ENUM':
+        if len(definition.get('options', [])) == 0:
+            raise ValueError('%s: ENUM needs a non-empty "options" list' % where)
+        return
+    if 'min' not in definition or 'max' not in definition or definition['min'] > definition['max']:
+        raise ValueError('%s: "min" <= "max" are needed' % where)
+    if definition.get('scale', 'linear') not in ['linear', 'log']:
+        raise ValueError('%s: "scale" must be linear or log' % where)
+    if definition.get('scale', 'linear') == 'log' and definition['min'] <= 0:
+        raise ValueError('%s: log scale needs "min" > 0' % where)
+
+
+def parse_template(source):
+    """
+        Find the HYPERPARAM{...} declarations of a network definition (JSON
+    objects, matched as a whole) and replace each of them with a reference to
+    the value of its token, __hyperparams__['token'].
+
+    :param source: the network definition
+    :return: the parsed (ast) module, the definitions {token: definition} and
+             the tokens in order of declaration
+    """
+    decoder = json.JSONDecoder()
+    chunks, definitions, tokens, position = [], {}, [], 0
+    while True:
+        match = DECLARATION.search(source, position)
+        if match is None:
+            break
+        line = source.count('\n', 0, match.start()) + 1
+        line_start = source.rfind('\n', 0, match.start()) + 1
+        if source[line_start:match.start()].lstrip().startswith('#'):
+            chunks.append(source[position:match.end()])  # commented out
+            position = match.end()
+            continue
+        try:
+            definition, end = decoder.raw_decode(source, match.end() - 1)
+        except ValueError:
+            raise ValueError('Malformed HYPERPARAM declaration at line %d' % line)
+        check_definition(definition, line)
+        token = str(definition['token'])
+        if token in definitions:
+            raise ValueError('Token "%s" used in multiple hyper-parameter definitions' % token)
+        definitions[token] = definition
+        tokens.append(token)
+        # (keep the line numbers of the definition for the tracebacks)
+        chunks.append(source[position:match.start()])
+        chunks.append('%s[%r]' % (PARAMS_NAME, token) + '\n' * source.count('\n', match.start(), end))
+        position = end
+    chunks.append(source[position:])
+    return ast.parse(''.join(chunks)), definitions, tokens
+
+
+def param_reference(node):
+    """
+        Token of a __hyperparams__['token'] expression, None for anything else.
+    """
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == PARAMS_NAME \
+            and isinstance(node.slice, ast.Index) and isinstance(node.slice.value, ast.Str):
+        return node.slice.value.s
+    return None
+
+
+def search_domain(definition):
+    """
+        The domain seen by the optimizer: INT/FLOAT (min, max) or ENUM
+    (options, as strings). Log-scale parameters are searched over the
+    (FLOAT) exponent.
+    """
+    if definition['type'] == 'ENUM':
+        return {'type': 'ENUM', 'options': [str(o) for o in definition['options']]}
+    if definition.get('scale', 'linear') == 'log':
+        return {'type': 'FLOAT', 'min': math.log10(definition['min']), 'max': math.log10(definition['max'])}
+    return {'type': definition['type'], 'min': definition['min'], 'max': definition['max']}
+
+
+def to_value(definition, value):
+    """
+        Suggested value (in the search domain) -> value of the parameter,
+    before its transform.
+    """
+    if definition['type'] == 'ENUM':
+        for option in definition['options']:
+            if option == value or str(option) == str(value):
+                return option
+        raise ValueError('Unknown option %s of %s' % (value, definition['token']))
+    if definition.get('scale', 'linear') == 'log':
+        value = 10.0 ** float(value)
+        return int(round(value)) if definition['type'] == 'INT' else value
+    return value
+
+
+def apply_transform(definition, value):
+    transform = definition.get('transform', None)
+    if transform is None:
+        return value
+
+    # X*: multiplier times a number * (e.g., X10, X100, X22)
+    if transform[0] == 'X':
+        value *= int(transform[1:])
+
+    # LOG*: log with base of number
+    if transform[0:3] == 'LOG':
+        value = math.log(value, int(transform[3:]))
+
+    # NEGEXP*: negative of exponent (e.g.,: NEGEXP10 of 3 = 10^-3)
+    if transform[0:6] == 'NEGEXP':
+        value = float(transform[6:]) ** float(-value)
+
+    return value
+
+
+def transform_params(hyperparam_definitions, params):
+    """
+        Map the suggested values (Spearmint format, {name: [value]}) to the
+    values used by the network, in place (log scale, ENUM options and the
+    transform of the definition).
+
+    :return: the values, {name: value}
+    """
+    for p in params:
+        definition = hyperparam_definitions[p]
+        params[p] = [apply_transform(definition, to_value(definition, params[p][0]))]
+    return dict((p, params[p][0]) for p in params)
+
+
+class _Unknown(Exception):
+    """
+        The static evaluation can not follow an expression/layer.
+    """
+
+
+class InvalidShape(Exception):
+    pass
+
+
+class _Array(object):
+    def __init__(self, shape):
+        self.shape = shape
+
+
+class _Sequential(object):
+    def __init__(self):
+        self.layers = []
+        self.complete = True
+
+
+_UNKNOWN = object()
+_CONSTANTS = {'None': None, 'True': True, 'False': False}
+_BUILTINS = {'int': int, 'float': float, 'min': min, 'max': max, 'abs': abs, 'round': round, 'len': len,
+             'range': range, 'tuple': tuple, 'list': list}
+_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+              ast.Div: lambda a, b: a / b, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+              ast.Pow: operator.pow}
+_SHAPE_PRESERVING = ['Activation', 'Dropout', 'SpatialDropout1D', 'SpatialDropout2D', 'SpatialDropout3D',
+                     'BatchNormalization', 'GaussianNoise', 'GaussianDropout', 'AlphaDropout', 'LeakyReLU',
+                     'PReLU', 'ELU', 'ThresholdedReLU', 'ReLU', 'Softmax']
+_LAYER_KIND = re.compile(r'^(Conv|Convolution|SeparableConv|MaxPooling|AveragePooling|MaxPool|AveragePool|'
+                         r'GlobalMaxPooling|GlobalAveragePooling|ZeroPadding|UpSampling)([123])D$')
+
+
+def _name(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+def _evaluate(node, env):
+    """
+        Evaluate the (side-effect free) expressions the layer arguments are
+    made of: numbers, strings, tuples, arithmetic, parameters, array shapes.
+    """
+    if isinstance(node, ast.Num):
+        return node.n
+    if isinstance(node, ast.Str):
+        return node.s
+    if isinstance(node, ast.Name):
+        if node.id in env:
+            return env[node.id]
+        if node.id in _CONSTANTS:
+            return _CONSTANTS[node.id]
+        raise _Unknown()
+    if isinstance(node, (ast.Tuple, ast.List)):
+        return tuple(_evaluate(e, env) for e in node.elts)
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.left, env), _evaluate(node.right, env))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = _evaluate(node.operand, env)
+        return -value if isinstance(node.op, ast.USub) else value
+    if isinstance(node, ast.Subscript):
+        value = _evaluate(node.value, env)
+        if isinstance(node.slice, ast.Index):
+            return value[_evaluate(node.slice.value, env)]
+        if isinstance(node.slice, ast.Slice):
+            bounds = [_evaluate(b, env) if b is not None else None
+                      for b in [node.slice.lower, node.slice.upper, node.slice.step]]
+            return value[slice(*bounds)]
+        raise _Unknown()
+    if isinstance(node, ast.Attribute) and node.attr == 'shape':
+        value = _evaluate(node.value, env)
+        if isinstance(value, _Array):
+            return value.shape
+        raise _Unknown()
+    if isinstance(node, ast.Call) and not node.keywords and node.starargs is None and node.kwargs is None:
+        if _name(node.func) == 'load_cache' and '__data__' in env:
+            return env['__data__']
+        if isinstance(node.func, ast.Name) and node.func.id in _BUILTINS:
+            try:
+                return _BUILTINS[node.func.id](*[_evaluate(a, env) for a in node.args])
+            except (TypeError, ValueError):
+                raise _Unknown()
+    raise _Unknown()
+
+
+def _bind(target, value, env):
+    if isinstance(target, ast.Name):
+        env[target.id] = value
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        if not isinstance(value, (tuple, list)) or len(value) != len(target.elts):
+            raise _Unknown()
+        for t, v in zip(target.elts, value):
+            _bind(t, v, env)
+    else:
+        raise _Unknown()
+
+
+def _unbind(target, env):
+    for node in ast.walk(target):
+        if isinstance(node, ast.Name):
+            env.pop(node.id, None)
+
+
+def _layer(call, env):
+    """
+        (kind, args, kwargs) of a layer constructor, the arguments that can
+    not be evaluated are left _UNKNOWN.
+    """
+    def value(node):
+        try:
+            return _evaluate(node, env)
+        except (_Unknown, IndexError, KeyError, TypeError, ZeroDivisionError):
+            return _UNKNOWN
+    return (_name(call.func), [value(a) for a in call.args],
+            dict((k.arg, value(k.value)) for k in call.keywords))
+
+
+def _adds_layers(statements):
+    return any(isinstance(n, ast.Call) and _name(n.func) in ['add', 'Sequential']
+               for s in statements for n in ast.walk(s))
+
+
+def _run(statements, env, depth=0):
+    """
+        Follow the statements of the network definition, collecting the
+    layers added to the Sequential models.
+    """
+    for statement in statements:
+        if isinstance(statement, ast.Assign):
+            value = statement.value
+            if isinstance(value, ast.Call) and _name(value.func) == 'Sequential':
+                model = _Sequential()
+                if len(value.args) > 0:
+                    if isinstance(value.args[0], ast.List):
+                        model.layers = [_layer(e, env) for e in value.args[0].elts if isinstance(e, ast.Call)]
+                        model.complete = all(isinstance(e, ast.Call) for e in value.args[0].elts)
+                    else:
+                        model.complete = False
+                for target in statement.targets:
+                    _bind(target, model, env)
+                continue
+            try:
+                value = _evaluate(value, env)
+                for target in statement.targets:
+                    _bind(target, value, env)
+            except (_Unknown, IndexError, KeyError, TypeError, ZeroDivisionError):
+                for target in statement.targets:
+                    _unbind(target, env)
+
+        elif isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call):
+            call = statement.value
+            if isinstance(call.func, ast.Attribute) and call.func.attr == 'add':
+                model = env.get(_name(call.func.value), None)
+                if isinstance(model, _Sequential):
+                    if len(call.args) == 1 and isinstance(call.args[0], ast.Call):
+                        model.layers.append(_layer(call.args[0], env))
+                    else:
+                        model.complete = False
+
+        elif isinstance(statement, ast.For) and depth < 10:
+            try:
+                iterable = _evaluate(statement.iter, env)
+                if len(iterable) > 1000:
+                    raise _Unknown()
+                for item in iterable:
+                    _bind(statement.target, item, env)
+                    _run(statement.body, env, depth + 1)
+            except (_Unknown, TypeError):
+                _incomplete(statement, env)
+
+        elif isinstance(statement, ast.If) and depth < 10:
+            try:
+                _run(statement.body if _evaluate(statement.test, env) else statement.orelse, env, depth + 1)
+            except (_Unknown, TypeError):
+                _incomplete(statement, env)
+
+        elif _adds_layers([statement]):
+            _incomplete(statement, env)
+
+
+def _incomplete(statement, env):
+    """
+        Layers may be added by a statement that can not be followed.
+    """
+    if _adds_layers([statement]):
+        for model in env.values():
+            if isinstance(model, _Sequential):
+                model.complete = False
+
+
+def _tuple(value, n):
+    if value is _UNKNOWN:
+        raise _Unknown()
+    if isinstance(value, (tuple, list)):
+        if len(value) != n or _UNKNOWN in value:
+            raise _Unknown()
+        return tuple(value)
+    return (value,) * n
+
+
+def _argument(args, kwargs, position, name, default):
+    if name in kwargs:
+        return kwargs[name]
+    if position is not None and position < len(args):
+        return args[position]
+    return default
+
+
+def _window(kind, i, spatial, window, strides, padding, dilation=None):
+    """
+        Spatial output dims of a convolution/pooling window (as in Keras).
+    """
+    output = []
+    for d in range(len(spatial)):
+        size = spatial[d]
+        extent = window[d] if dilation is None else dilation[d] * (window[d] - 1) + 1
+        if size is None:
+            output.append(None)
+        elif padding in ['same', 'causal']:
+            output.append(-(-size // strides[d]))
+        elif padding == 'valid':
+            if size < extent:
+                raise InvalidShape('layer %d (%s): %s window on a %s input' %
+                                   (i, kind, 'x'.join(map(str, window)), 'x'.join(map(str, spatial))))
+            output.append((size - extent) // strides[d] + 1)
+        else:
+            raise _Unknown()
+    return tuple(output)
+
+
+def _output_shape(i, layer, shape):
+    """
+        Output shape (without the batch axis) of a layer, raises InvalidShape
+    if the layer can not be applied to its input.
+    """
+    kind, args, kwargs = layer
+    if kind in _SHAPE_PRESERVING:
+        return shape
+    if kind == 'Flatten':
+        if None in shape:
+            raise _Unknown()
+        return (int(reduce(operator.mul, shape, 1)),)
+    if kind == 'Dense':
+        units = _argument(args, kwargs, 0, 'units', _UNKNOWN)
+        if units is _UNKNOWN:
+            raise _Unknown()
+        if units < 1:
+            raise InvalidShape('layer %d (Dense): %s units' % (i, units))
+        return shape[:-1] + (int(units),)
+
+    match = _LAYER_KIND.match(kind or '')
+    if match is None:
+        raise _Unknown()
+    family, n = match.group(1), int(match.group(2))
+    channels_first = kwargs.get('data_format', None) == 'channels_first'
+    if len(shape) != n + 1:
+        raise InvalidShape('layer %d (%s): %d-D input expected, got %s' % (i, kind, n + 1, shape))
+    spatial, channels = (shape[1:], shape[0]) if channels_first else (shape[:-1], shape[-1])
+
+    if family in ['Conv', 'Convolution', 'SeparableConv']:
+        filters = _argument(args, kwargs, 0, 'filters', _UNKNOWN)
+        if filters is _UNKNOWN:
+            raise _Unknown()
+        if filters < 1:
+            raise InvalidShape('layer %d (%s): %s filters' % (i, kind, filters))
+        window = _tuple(_argument(args, kwargs, 1, 'kernel_size', _UNKNOWN), n)
+        strides = _tuple(_argument(args, kwargs, 2, 'strides', 1), n)
+        padding = _argument(args, kwargs, 3, 'padding', 'valid')
+        dilation = _tuple(kwargs.get('dilation_rate', 1), n)
+        spatial, channels = _window(kind, i, spatial, window, strides, padding, dilation), int(filters)
+    elif family in ['MaxPooling', 'AveragePooling', 'MaxPool', 'AveragePool']:
+        window = _tuple(_argument(args, kwargs, 0, 'pool_size', 2), n)
+        strides = _argument(args, kwargs, 1, 'strides', None)
+        strides = window if strides is None else _tuple(strides, n)
+        spatial = _window(kind, i, spatial, window, strides, _argument(args, kwargs, 2, 'padding', 'valid'))
+    elif family in ['GlobalMaxPooling', 'GlobalAveragePooling']:
+        return (channels,)
+    elif family == 'ZeroPadding':
+        padding = _argument(args, kwargs, 0, 'padding', 1)
+        padding = [sum(_tuple(p, 2)) for p in _tuple(padding, n)]
+        spatial = tuple(s + p if s is not None else None for s, p in zip(spatial, padding))
+    elif family == 'UpSampling':
+        size = _tuple(_argument(args, kwargs, 0, 'size', 2), n)
+        spatial = tuple(s * f if s is not None else None for s, f in zip(spatial, size))
+    return (channels,) + spatial if channels_first else spatial + (channels,)
+
+
+class NetworkTemplate(object):
+    """
+        A network definition (network_def.py) compiled once into a
+    parameterized model builder: the HYPERPARAM{...} declarations become
+    references to the builder's argument, so that each trial only calls a
+    function (no string substitution, generated files or exec).
+
+    The Sequential model is also followed statically, to check the layer
+    shapes of a configuration (e.g., kernels larger than their feature
+    maps) before any data is loaded, and to prune the search space.
+    """
+
+    def __init__(self, source, filename='network_def.py', data_meta=None):
+        self.source = source
+        self.filename = filename
+        self.tree, self.definitions, self.tokens = parse_template(source)
+        if len(self.tokens) == 0:
+            raise ValueError('No hyper-parameters!! Make sure you define them in %s' % filename)
+        self.data = None
+        if data_meta is not None:
+            x_shape = (None,) + tuple(data_meta['input_shape'])
+            y_shape = (None, data_meta['num_classes'])
+            self.data = ((_Array(x_shape), _Array(y_shape)), (_Array(x_shape), _Array(y_shape)))
+        self.builder = self._compile()
+
+    @classmethod
+    def load(cls, path, meta_file=None):
+        with open(path, 'r') as f:
+            source = f.read()
+        data_meta = None
+        if meta_file is not None and os.path.exists(meta_file):
+            with open(meta_file, 'r') as f:
+                data_meta = json.load(f)
+        return cls(source, path, data_meta)
+
+    def _compile(self):
+        """
+            Wrap the module in def build_network(__hyperparams__): ... return locals()
+        """
+        module = ast.parse('def %s(%s):\n    pass\n' % (BUILDER_NAME, PARAMS_NAME))
+        function = module.body[0]
+        function.body = self.tree.body + ast.parse('return locals()').body
+        ast.fix_missing_locations(module)
+        namespace = {}
+        exec compile(module, self.filename, 'exec') in namespace
+        return namespace[BUILDER_NAME]
+
+    def build(self, values):
+        """
+            Run the network definition for the given parameter values.
+
+        :param values: the (transformed) values, {token: value}
+        :return: the namespace of the definition (model, x_train, ..., batch_size)
+        """
+        return self.builder(values)
+
+    def check_shapes(self, values):
+        """
+            Statically check the layer shapes of the model for the given
+        (transformed) values.
+
+        :return: None if valid (or not known), otherwise the reason
+        """
+        env = {PARAMS_NAME: values}
+        if self.data is not None:
+            env['__data__'] = self.data
+        _run(self.tree.body, env)
+        model = env.get('model', None)
+        if not isinstance(model, _Sequential) or not model.complete:
+            return None
+
+        shape = None
+        for i, layer in enumerate(model.layers):
+            input_shape = layer[2].get('input_shape', None)
+            if input_shape is not None:
+                if input_shape is _UNKNOWN or _UNKNOWN in input_shape:
+                    return None
+                shape = tuple(input_shape)
+            if shape is None:
+                return None
+            try:
+                shape = _output_shape(i + 1, layer, shape)
+            except InvalidShape as e:
+                return str(e)
+            except (_Unknown, TypeError):
+                return None
+        return None
+
+    def shape_parameters(self):
+        """
+            Tokens that (possibly) affect the spatial shapes: used by layer
+        arguments other than the number of filters/units, or by the loops
+        and conditions of the definition.
+        """
+        # tokens each variable depends on (fixed point over the assignments)
+        depends = {}
+        assignments = [n for n in ast.walk(self.tree) if isinstance(n, (ast.Assign, ast.For))]
+        changed = True
+        while changed:
+            changed = False
+            for node in assignments:
+                value, targets = (node.value, node.targets) if isinstance(node, ast.Assign) \
+                    else (node.iter, [node.target])
+                tokens = self._tokens(value, depends)
+                for target in targets:
+                    for name in [n.id for n in ast.walk(target) if isinstance(n, ast.Name)]:
+                        if not tokens <= depends.get(name, set()):
+                            depends[name] = depends.get(name, set()) | tokens
+                            changed = True
+
+        relevant = set()
+        for node in ast.walk(self.tree):
+            if isinstance(node, (ast.For, ast.If, ast.While)):
+                relevant |= self._tokens(node.iter if isinstance(node, ast.For) else node.test, depends)
+            elif isinstance(node, ast.Call) and _LAYER_KIND.match(_name(node.func) or ''):
+                position, name = (0, 'filters') if 'Conv' in _name(node.func) else (None, None)
+                arguments = [a for j, a in enumerate(node.args) if j != position] + \
+                            [k.value for k in node.keywords if k.arg not in [name, 'activation', 'name']]
+                for argument in arguments:
+                    relevant |= self._tokens(argument, depends)
+        return sorted(relevant)
+
+    @staticmethod
+    def _tokens(node, depends):
+        tokens = set()
+        for n in ast.walk(node):
+            token = param_reference(n)
+            if token is not None:
+                tokens.add(token)
+            elif isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load):
+                tokens |= depends.get(n.id, set())
+        return tokens
+
+    def prune(self, max_points=10000, float_points=5):
+        """
+            Check the shapes over the grid of the shape parameters (the other
+        parameters at their minimum) and shrink the INT ranges/ENUM options to
+        the values with at least one valid architecture. The invalid
+        configurations left inside the pruned space are rejected per trial
+        (check_shapes).
+
+        :param max_points: largest grid checked
+        :param float_points: grid points per FLOAT parameter
+        :return: the pruned definitions, a summary {checked, invalid, pruned: {token: (before, after)}}
+                 (None if the grid is too large); raises ValueError if there is
+                 no valid architecture at all
+        """
+        relevant = self.shape_parameters()
+        grids = []
+        for token in relevant:
+            domain = search_domain(self.definitions[token])
+            if domain['type'] == 'ENUM':
+                grids.append(domain['options'])
+            elif domain['type'] == 'INT':
+                grids.append(range(int(domain['min']), int(domain['max']) + 1))
+            else:
+                step = (domain['max'] - domain['min']) / float(max(float_points - 1, 1))
+                grids.append([domain['min'] + k * step for k in range(float_points)])
+        if reduce(operator.mul, [len(g) for g in grids], 1) > max_points:
+            return dict(self.definitions), None
+
+        defaults = {}
+        for token in self.tokens:
+            domain = search_domain(self.definitions[token])
+            defaults[token] = [domain['options'][0] if domain['type'] == 'ENUM' else domain['min']]
+
+        feasible, checked, invalid = [], 0, 0
+        for point in itertools.product(*grids):
+            params = dict(defaults)
+            params.update(dict((token, [value]) for token, value in zip(relevant, point)))
+            checked += 1
+            if self.check_shapes(transform_params(self.definitions, params)) is None:
+                feasible.append(point)
+            else:
+                invalid += 1
+        if len(feasible) == 0:
+            raise ValueError('No valid architecture in the search space (%d configurations checked)' % checked)
+
+        definitions, pruned = dict(self.definitions), {}
+        for k, token in enumerate(relevant):
+            definition = dict(self.definitions[token])
+            values = sorted(set(point[k] for point in feasible))
+            if definition['type'] == 'ENUM':
+                options = [o for o in definition['options'] if str(o) in values]
+                if len(options) < len(definition['options']):
+                    pruned[token] = (definition['options'], options)
+                    definition['options'] = options
+            elif definition['type'] == 'INT' and definition.get('scale', 'linear') == 'linear':
+                if values[0] > definition['min'] or values[-1] < definition['max']:
+                    pruned[token] = ([definition['min'], definition['max']], [values[0], values[-1]])
+                    definition['min'], definition['max'] = values[0], values[-1]
+            definitions[token] = definition
+        return definitions, {'checked': checked, 'invalid': invalid, 'pruned': pruned}
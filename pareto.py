@@ -0,0 +1,239 @@
+import numpy as np
+import bisect, json
+import os, copy
+import cPickle
+from bayesopt import SearchSpace, GaussianProcess
+from executor import get_executor
+from trial_store import TrialStore, template_hash
+
+FRONT_FILE = '../pareto_front.json'  # relative to the Spearmint working dir (i.e., in the experiment dir)
+TRIALS_FILE = '../tmp/pareto_trials.jsonl'
+
+
+def dominates(a, b):
+    return all(x <= y for x, y in zip(a, b)) and any(x < y for x, y in zip(a, b))
+
+
+class ParetoArchive(object):
+    """
+        Non-dominated set of points (to minimize), kept sorted
+    (lexicographically): a point can only be dominated by the points before
+    it and only dominate the points after it. With two objectives, the
+    second one decreases along the front, so a new point is only compared
+    with its predecessor and the run of points it dominates.
+    """
+
+    def __init__(self):
+        self.points, self.payloads = [], []
+
+    def add(self, point, payload=None):
+        """
+            Insert a point unless it is dominated (or already in the front),
+        removing the points it dominates.
+
+        :return: True if the point entered the front
+        """
+        point = tuple(float(v) for v in point)
+        i = bisect.bisect_left(self.points, point)
+        if i < len(self.points) and self.points[i] == point:
+            return False
+
+        if len(point) == 2:
+            if i > 0 and self.points[i - 1][1] <= point[1]:
+                return False
+            end = i
+            while end < len(self.points) and self.points[end][1] >= point[1]:
+                end += 1
+        else:
+            if any(dominates(p, point) for p in self.points[:i]):
+                return False
+            kept = [k for k in range(i, len(self.points)) if not dominates(point, self.points[k])]
+            self.points[i:] = [self.points[k] for k in kept]
+            self.payloads[i:] = [self.payloads[k] for k in kept]
+            end = i
+
+        self.points[i:end] = [point]
+        self.payloads[i:end] = [payload]
+        return True
+
+    def __len__(self):
+        return len(self.points)
+
+
+def hypervolume(points, reference):
+    """
+        Volume dominated by the points (and bounded by the reference point),
+    exact, by slicing along the last objective (fine for the few tens of
+    points of a front).
+    """
+    points = [tuple(p) for p in points if all(x < r for x, r in zip(p, reference))]
+    if len(points) == 0:
+        return 0.0
+    if len(reference) == 1:
+        return reference[0] - min(p[0] for p in points)
+    if len(reference) == 2:
+        volume, best = 0.0, reference[1]
+        for x, y in sorted(points):
+            if y < best:
+                volume += (reference[0] - x) * (best - y)
+                best = y
+        return volume
+
+    points = sorted(points, key=lambda p: p[-1])
+    volume = 0.0
+    for i, p in enumerate(points):
+        upper = points[i + 1][-1] if i + 1 < len(points) else reference[-1]
+        if upper > p[-1]:
+            volume += (upper - p[-1]) * hypervolume([q[:-1] for q in points[:i + 1]], reference[:-1])
+    return volume
+
+
+def suggest_pareto(space, X, Y, q, rng, kappa=1.0, n_candidates=1000):
+    """
+        Hypervolume-based acquisition (as in SMS-EGO): the hypervolume
+    improvement of the optimistic (lower confidence bound) prediction of the
+    objectives; candidates predicted to be dominated get a penalty, their
+    distance to the front. Objectives are normalized by their observed
+    ranges, the reference point is 1.1 (10% beyond the worst values). A
+    batch of q points is built with the kriging believer heuristic.
+
+    :param space: the SearchSpace
+    :param X: the evaluated points (unit cube), (n, d)
+    :param Y: their objective values, (n, m)
+    :param q: number of points to suggest
+    :param rng: numpy RandomState
+    :return: list of q points (unit cube)
+    """
+    X, Y = np.array(X), np.array(Y, dtype=float)
+    low, high = Y.min(axis=0), Y.max(axis=0)
+    scale = np.where(high > low, high - low, 1.0)
+    Y = (Y - low) / scale
+    reference = [1.1] * Y.shape[1]
+    front = ParetoArchive()
+    for y in Y:
+        front.add(y)
+    gps = [GaussianProcess(rng) for _ in range(Y.shape[1])]
+    batch = []
+
+    for i in range(q):
+        if len(X) < 2:
+            batch.append(space.sample(1, rng)[0])  # not enough data for a model yet
+            continue
+
+        # candidates: random points, plus perturbations of the points of the front
+        candidates = space.sample(n_candidates, rng)
+        front_points = X[[k for k in range(len(Y)) if tuple(Y[k]) in set(front.points)]]
+        local = front_points[rng.randint(len(front_points), size=n_candidates // 2)] + \
+            rng.normal(scale=0.05, size=(n_candidates // 2, X.shape[1]))
+        candidates = np.vstack([candidates, [space.encode(space.decode(u)) for u in np.clip(local, 0, 1)]])
+
+        means, lcb = [], []
+        for k, gp in enumerate(gps):
+            gp.fit(X, Y[:, k], refit=(i == 0))
+            mean, std = gp.predict(candidates)
+            means.append(mean)
+            lcb.append(mean - kappa * std)
+        means, lcb = np.array(means).T, np.array(lcb).T
+
+        F = np.array(front.points)
+        base = hypervolume(front.points, reference)
+        dominating = np.all(F[np.newaxis, :, :] <= lcb[:, np.newaxis, :], axis=2)  # (candidates, front)
+        distance = np.min(lcb[:, np.newaxis, :] - F[np.newaxis, :, :], axis=2)
+        acquisition = np.where(dominating, -distance, -np.inf).max(axis=1)
+        for c in np.where(~dominating.any(axis=1))[0]:
+            acquisition[c] = hypervolume(front.points + [tuple(lcb[c])], reference) - base
+
+        best = np.argmax(acquisition)
+        batch.append(candidates[best])
+
+        # kriging believer: pretend that the point was evaluated at the predicted values
+        X = np.vstack([X, candidates[best]])
+        Y = np.vstack([Y, means[best]])
+        front.add(means[best])
+
+    return batch
+
+
+def write_front(archive, objectives, path=FRONT_FILE):
+    """
+        Store the current front (sorted by the first objective), replacing
+    the previous one atomically.
+    """
+    front = [dict(zip(objectives, point), params=params) for point, params in zip(archive.points, archive.payloads)]
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'objectives': objectives, 'front': front}, f, indent=2)
+    os.rename(path + '.tmp', path)
+
+
+def run_pareto(hyperpowerparams, max_trials=100, initial_trials=5, seed=None):
+    """
+        Multi-objective search of the error vs HW cost trade-off: the
+    non-dominated trials are kept in a Pareto archive, written to the
+    experiment directory (pareto_front.json) as the search runs.
+
+    :param hyperpowerparams: the hyperpower parameters of the experiment
+    :param max_trials: number of trials to evaluate
+    :param initial_trials: random trials before the GP models are used
+    :param seed: seed of the optimizer
+    :return: the Pareto archive
+    """
+    experiment = hyperpowerparams['experiment']
+    objectives = hyperpowerparams['objectives']
+    q = int(hyperpowerparams.get('workers', 1))
+    rng = np.random.RandomState(seed)
+
+    # keras_run works relative to the Spearmint directory of the experiment
+    cwd = os.getcwd()
+    os.chdir(experiment + '/spearmint')
+    try:
+        with open('../tmp/hyperparam_definitions.pkl', 'rb') as f:
+            space = SearchSpace(cPickle.load(f))
+        executor = get_executor(hyperpowerparams)
+        archive = ParetoArchive()
+
+        X, Y, trials = [], [], 0
+        if hyperpowerparams.get('resume', False):
+            # seed the models (and the front) with the compatible trials of previous searches
+            for params, result in TrialStore().compatible(hyperpowerparams, template_hash(), space.names):
+                try:
+                    u = space.encode(dict((p, [params[p]]) for p in params))
+                except ValueError:
+                    continue  # ENUM option pruned from the space
+                y = [float(result[m]) for m in objectives]
+                if np.all((u >= 0) & (u <= 1)) and not np.any(np.isnan(y)):
+                    X.append(u)
+                    Y.append(y)
+                    archive.add(y, dict((p, [params[p]]) for p in params))
+            print "Warm start from %d previous trials, %d on the front" % (len(X), len(archive))
+            write_front(archive, objectives)
+
+        while trials < max_trials:
+            n = min(q, max_trials - trials)
+            if trials < initial_trials or len(X) < 2:
+                batch = space.sample(n, rng)
+            else:
+                batch = suggest_pareto(space, X, Y, n, rng)
+
+            # keras_run transforms the params in place, hand over copies
+            suggested = [space.decode(u) for u in batch]
+            results = executor.map([(copy.deepcopy(params), None, None) for params in suggested])
+            for u, params, (result, hw_metrics) in zip(batch, suggested, results):
+                trials += 1
+                y = [float(result[m]) for m in objectives]
+                with open(TRIALS_FILE, 'a') as f:
+                    f.write(json.dumps({'params': params, 'objectives': dict(zip(objectives, y))}) + '\n')
+                if np.any(np.isnan(y)):
+                    continue  # failed trial
+                X.append(u)
+                Y.append(y)
+                if archive.add(y, params):
+                    print "New Pareto point (trial %d):" % trials, dict(zip(objectives, y))
+                    write_front(archive, objectives)
+
+        executor.close()
+        print "Pareto search done: %d trials, %d points on the front" % (trials, len(archive))
+        for point, params in zip(archive.points, archive.payloads):
+            print dict(zip(objectives, point)), params
+        return archive
+    finally:
+        os.chdir(cwd)
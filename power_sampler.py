@@ -0,0 +1,220 @@
+import numpy as np
+import collections, glob, os
+import subprocess, threading, time
+from timeit import default_timer as timer  # same clock as benchmark.py
+
+BACKENDS = ['nvidia-smi', 'rapl', 'replay']
+RAPL_ROOT = '/sys/class/powercap'
+
+
+class PowerSampler(object):
+    """
+        Read power samples (W) in a background thread into a timestamped ring
+    buffer, so that the energy can be integrated over the exact intervals in
+    which the inference was timed. Backends implement `_open`, `_read` (block
+    until the next sample, return the power or None at the end of the stream)
+    and `_close`.
+    """
+
+    def __init__(self, buffer_size=100000):
+        self.samples = collections.deque(maxlen=buffer_size)  # (timestamp, power)
+        self._stopped = threading.Event()
+        self._first_sample = threading.Event()
+        self._thread = None
+
+    def _open(self):
+        pass
+
+    def _read(self):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+    def _run(self):
+        while not self._stopped.is_set():
+            power = self._read()
+            if power is None:
+                break
+            self.samples.append((timer(), power))
+            self._first_sample.set()
+
+    def start(self, timeout=10.0):
+        """
+            Start sampling, wait (up to timeout seconds) for the first sample.
+        """
+        self._open()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        self._first_sample.wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+        self._close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def energy(self, intervals):
+        """
+            Energy (J) over the given [(start, end), ...] intervals: the power
+        trace is linearly interpolated between samples and integrated.
+        """
+        if len(self.samples) == 0:
+            raise ValueError('No power samples were collected')
+        times, power = np.array(self.samples).T
+
+        total = 0.0
+        for start, end in intervals:
+            inside = times[(times > start) & (times < end)]
+            points = np.concatenate([[start], inside, [end]])
+            total += np.trapz(np.interp(points, times, power), points)
+        return total
+
+    def mean_power(self, intervals):
+        """
+            Average power (W) over the given intervals.
+        """
+        duration = sum(end - start for start, end in intervals)
+        return self.energy(intervals) / duration
+
+
+class NvidiaSmiSampler(PowerSampler):
+    """
+        GPU board power, streamed from `nvidia-smi` over a pipe.
+    """
+
+    def __init__(self, device=0, interval_ms=1, **kwargs):
+        super(NvidiaSmiSampler, self).__init__(**kwargs)
+        self.command = ['nvidia-smi', '-i', str(device), '--query-gpu=power.draw',
+                        '--format=csv,noheader,nounits', '-lms', str(interval_ms)]
+        self._process = None
+
+    def _open(self):
+        self._process = subprocess.Popen(self.command, stdout=subprocess.PIPE, shell=False)
+
+    def _read(self):
+        while True:
+            line = self._process.stdout.readline()
+            if line == '':
+                return None  # nvidia-smi exited
+            try:
+                return float(line.strip())
+            except ValueError:
+                continue  # e.g., '[Not Supported]'
+
+    def _close(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+
+class RaplSampler(PowerSampler):
+    """
+        CPU package power from the Linux powercap (Intel RAPL) energy counters,
+    summed over all the packages.
+    """
+
+    def __init__(self, interval=0.005, **kwargs):
+        super(RaplSampler, self).__init__(**kwargs)
+        self.interval = interval
+        self.domains = rapl_domains()
+        self._last = None
+
+    def _counters(self):
+        values = []
+        for domain in self.domains:
+            with open(os.path.join(domain, 'energy_uj'), 'r') as f:
+                values.append(int(f.read()))
+        return timer(), values
+
+    def _read(self):
+        if self._last is None:
+            self._last = self._counters()
+        time.sleep(self.interval)
+        now, values = self._counters()
+        last_time, last_values = self._last
+        self._last = (now, values)
+
+        energy_uj = 0
+        for domain, value, last_value in zip(self.domains, values, last_values):
+            if value < last_value:  # counter wrapped around
+                with open(os.path.join(domain, 'max_energy_range_uj'), 'r') as f:
+                    value += int(f.read())
+            energy_uj += value - last_value
+        return energy_uj * 1e-6 / (now - last_time)
+
+
+class ReplaySampler(PowerSampler):
+    """
+        Deterministic power trace, replayed from a file (one `offset_s power_w`
+    pair per line, repeated periodically) or a constant power; for tests and
+    hosts without a power sensor.
+    """
+
+    def __init__(self, trace=None, power=100.0, interval=0.001, **kwargs):
+        super(ReplaySampler, self).__init__(**kwargs)
+        if trace is not None:
+            self.offsets, self.values = np.loadtxt(trace, ndmin=2).T
+        else:
+            self.offsets, self.values = np.array([0.0]), np.array([power])
+        self.period = self.offsets[-1] + interval
+        self.interval = interval
+        self._start = None
+
+    def _read(self):
+        if self._start is None:
+            self._start = timer()
+        else:
+            time.sleep(self.interval)
+        offset = (timer() - self._start) % self.period
+        return float(self.values[np.searchsorted(self.offsets, offset, side='right') - 1])
+
+
+def rapl_domains():
+    """
+        Top-level (package) RAPL domains of the host.
+    """
+    return sorted(d for d in glob.glob(RAPL_ROOT + '/intel-rapl:*') if d.count(':') == 1)
+
+
+def get_sampler(backend, trace=None, interval=None):
+    """
+        Instantiate the power sampler of the given backend (optionally with
+    a sampling interval (s) other than the default one).
+    """
+    if backend == 'nvidia-smi':
+        return NvidiaSmiSampler() if interval is None else NvidiaSmiSampler(interval_ms=int(interval * 1000))
+    if backend == 'rapl':
+        return RaplSampler() if interval is None else RaplSampler(interval)
+    if backend == 'replay':
+        return ReplaySampler(trace) if interval is None else ReplaySampler(trace, interval=interval)
+    raise ValueError("Unknown power backend '%s'" % backend)
+
+
+def check_backend(backend, trace=None):
+    """
+        Make sure that the power backend is usable on this host.
+
+    :return: None if it is, otherwise the error message
+    """
+    if backend == 'nvidia-smi':
+        try:
+            devnull = open(os.devnull, 'w')
+            subprocess.call('nvidia-smi', shell=False, stdout=devnull, stderr=devnull)
+        except subprocess.CalledProcessError:
+            return "Errors with nvidia-smi?? Is it properly installed"
+        except OSError:
+            return "nvidia-smi (executable) not found!! Is it installed??"
+    elif backend == 'rapl':
+        domains = rapl_domains()
+        if len(domains) == 0:
+            return "No RAPL domains found at %s!! Is the powercap driver loaded??" % RAPL_ROOT
+        if not os.access(os.path.join(domains[0], 'energy_uj'), os.R_OK):
+            return "RAPL energy counters are not readable (permissions)!!"
+    elif backend == 'replay':
+        if trace is not None and not os.path.exists(trace):
+            return "Power trace file %s not found!!" % trace
+    else:
+        return "Unknown power backend '%s'!!" % backend
+    return None
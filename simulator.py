@@ -0,0 +1,255 @@
+import numpy as np
+import cPickle, json
+import glob, os
+from bayesopt import SearchSpace, GaussianProcess
+from trial_store import TrialStore, result_from_metrics
+from cost_model import HW_METRICS, TRAIN_METRICS
+from net_compiler import plain_value
+
+SIMULATION_LOG = '../results/simulation-%s.jsonl'  # one per search, relative to the Spearmint working dir
+SURROGATES = ['nearest', 'gp']
+
+_simulator = None  # simulator of this process (loaded once)
+
+
+class TrialSimulator(object):
+    """
+        Recorded trials (the trial store of the experiment) served in place
+    of keras_run. The metrics of a configuration are those of the nearest
+    recorded trial (the trial itself if it was evaluated), or the predictive
+    mean of a GP fit of each metric over the recorded trials. The error after
+    a given number of epochs comes from the recorded learning curves, and the
+    simulated cost of a trial from the recorded wall times.
+    """
+
+    def __init__(self, hyperparam_definitions, records, surrogate='nearest', seed=None):
+        self.space = SearchSpace(hyperparam_definitions)
+        self.surrogate = surrogate
+        self.rng = np.random.RandomState(seed)
+        self.trials = []  # (unit cube point, record)
+        for record in records:
+            if sorted(record['params'].keys()) != self.space.names:
+                continue
+            try:
+                u = self.space.encode(dict((p, [record['params'][p]]) for p in record['params']))
+            except ValueError:
+                continue  # ENUM option not in the space (anymore)
+            self.trials.append((u, record))
+        self._models = {}
+
+    @staticmethod
+    def _value(record, metric, epochs):
+        """
+            Recorded value of a metric; the error after `epochs` epochs and
+        the wall times of trained trials scaled to `epochs` epochs (training
+        dominates).
+        """
+        if metric == 'error':
+            if record.get('curve', None):
+                return 100.0 - 100.0 * record['curve'][min(epochs, len(record['curve'])) - 1]
+            return record['metrics'].get('error', None)
+        trained = 'error' in record['metrics']
+        if metric == 'duration':
+            if record.get('duration', None) is None or not trained:
+                return None
+            return record['duration'] * epochs / float(record['epochs'])
+        if metric == 'untrained_duration':
+            return record.get('duration', None) if not trained else None
+        return record['metrics'].get(metric, None)
+
+    def _predict(self, metric, epochs, u):
+        key = (metric, epochs)
+        if key not in self._models:
+            X, y = [], []
+            for v, record in self.trials:
+                value = self._value(record, metric, epochs)
+                if value is not None and not np.isnan(value):
+                    X.append(v)
+                    y.append(value)
+            model = None
+            if len(y) >= 2 and self.surrogate == 'gp':
+                model = GaussianProcess(self.rng).fit(np.array(X), np.array(y))
+            elif len(y) > 0:
+                model = (np.array(X), np.array(y))
+            self._models[key] = model
+
+        model = self._models[key]
+        if model is None:
+            return None
+        if isinstance(model, GaussianProcess):
+            return float(model.predict(u[np.newaxis])[0][0])
+        X, y = model
+        return float(y[np.argmin(np.sum((X - u) ** 2, axis=1))])
+
+    def simulate(self, params, epochs, hyperpowerparams):
+        """
+            Simulated trial.
+
+        :param params: the suggested values (Spearmint format, {name: [value]})
+        :param epochs: training epochs
+        :param hyperpowerparams: the hyperpower parameters of the search
+        :return: the result (as from keras_run), the simulated wall time (s) and the metrics
+        """
+        u = self.space.encode(params)
+        metrics = {}
+        for metric in ['error'] + HW_METRICS + TRAIN_METRICS + ['duration', 'untrained_duration']:
+            value = self._predict(metric, epochs, u)
+            if value is not None:
+                metrics[metric] = value
+
+        result = result_from_metrics(metrics, hyperpowerparams)
+        if result is None:
+            raise ValueError('The recorded trials do not have the metrics of this search')
+
+        # trained, unless an HW constraint is violated (then only profiled)
+        optimize, constraint = hyperpowerparams['optimize'], hyperpowerparams.get('constraint', '')
+        trained = hyperpowerparams['exec_mode'] != 'constrained' or optimize != 'error' or \
+            metrics[constraint] < float(hyperpowerparams['constraint_val'])
+        duration = metrics.get('duration' if trained else 'untrained_duration', metrics.get('duration', 0.0))
+        return result, duration, metrics
+
+
+def get_simulator(hyperpowerparams):
+    global _simulator
+    if _simulator is None:
+        with open('../tmp/hyperparam_definitions.pkl', 'rb') as f:
+            hyperparam_definitions = cPickle.load(f)
+        _simulator = TrialSimulator(hyperparam_definitions, TrialStore().records(),
+                                    hyperpowerparams.get('surrogate', 'nearest'))
+    return _simulator
+
+
+def objective_value(result, hyperpowerparams):
+    """
+        Objective of a result and whether it is feasible.
+    """
+    if hyperpowerparams['exec_mode'] == 'unconstrained':
+        return float(result), True
+    if hyperpowerparams['exec_mode'] == 'pareto':
+        return float(result['error']), True  # (the convergence of the error, the front is in the trials log)
+    value = float(result[hyperpowerparams['optimize']])
+    return value, not np.isnan(value) and result[hyperpowerparams['constraint']] >= 0
+
+
+def simulate_trial(params, epochs=None, hyperpowerparams=None, batch=None):
+    """
+        Simulated keras_run: the result of the configuration, appended with
+    its simulated cost to the simulation log of the search. Also returns the
+    simulated metrics.
+    """
+    if hyperpowerparams is None:
+        with open('../tmp/hyperpowerparams.pkl', 'rb') as f:
+            hyperpowerparams = cPickle.load(f)
+    epochs = int(epochs or hyperpowerparams['epochs'])
+    result, duration, metrics = get_simulator(hyperpowerparams).simulate(params, epochs, hyperpowerparams)
+    objective, feasible = objective_value(result, hyperpowerparams)
+
+    record = {'params': dict((p, plain_value(params[p][0])) for p in params), 'epochs': epochs,
+              'metrics': metrics, 'duration': duration, 'objective': objective, 'feasible': feasible,
+              'batch': batch}
+    with open(SIMULATION_LOG % hyperpowerparams['search_id'], 'a') as f:
+        f.write(json.dumps(record) + '\n')
+    return result, metrics
+
+
+class SimulatedExecutor(object):
+    """
+        Executor (as in executor.py) of the built-in schedulers that simulates
+    the trials. The trials of a map() call run in parallel: the simulated
+    wall clock advances by the longest one.
+    """
+
+    def __init__(self, hyperpowerparams):
+        self.hyperpowerparams = hyperpowerparams
+        self.batches = 0
+
+    def map(self, tasks):
+        results = []
+        for params, epochs, hw_metrics in tasks:
+            result, metrics = simulate_trial(params, epochs, self.hyperpowerparams, self.batches)
+            if hw_metrics is not None:
+                hw_metrics.update(dict((m, metrics[m]) for m in HW_METRICS if m in metrics))
+            results.append((result, hw_metrics))
+        self.batches += 1
+        return results
+
+    def close(self):
+        pass
+
+
+def convergence(path):
+    """
+        Convergence curve of a simulated search: after each trial, the
+    simulated GPU-hours (sum of the trial times), wall-clock hours (parallel
+    trials overlap) and the best feasible objective so far (None before the
+    first feasible trial).
+    """
+    with open(path, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    curve, gpu_hours, batches, best = [], 0.0, {}, None
+    for i, record in enumerate(records):
+        gpu_hours += record['duration'] / 3600.0
+        batch = record['batch'] if record['batch'] is not None else -(i + 1)  # Spearmint: one trial at a time
+        batches[batch] = max(batches.get(batch, 0.0), record['duration'] / 3600.0)
+        if record['feasible'] and (best is None or record['objective'] < best):
+            best = record['objective']
+        curve.append({'trial': i + 1, 'gpu_hours': gpu_hours, 'wall_hours': sum(batches.values()),
+                      'best': best})
+    return curve
+
+
+def report_simulation(path, settings=None, rows=10):
+    """
+        Print the convergence curve of a simulated search, and store it (with
+    the settings of the search) next to its log for later comparisons.
+    """
+    curve = convergence(path) if os.path.exists(path) else []
+    if len(curve) == 0:
+        print "No simulated trials found at %s" % path
+        return None
+    print "%8s %12s %12s %14s" % ('trial', 'GPU-hours', 'wall-hours', 'best feasible')
+    step = max(len(curve) // rows, 1)
+    shown = curve[step - 1::step]
+    if shown[-1] is not curve[-1]:
+        shown.append(curve[-1])
+    for point in shown:
+        print "%8d %12.2f %12.2f %14s" % (point['trial'], point['gpu_hours'], point['wall_hours'],
+                                          '%.3f' % point['best'] if point['best'] is not None else '-')
+    with open(os.path.splitext(path)[0] + '.json', 'w') as f:
+        json.dump({'settings': settings, 'curve': curve}, f, indent=2)
+    return curve
+
+
+def compare_simulations(results_dir, points=5):
+    """
+        Best feasible objective of each simulated search of the experiment at
+    the same simulated GPU-hours (up to the shortest search).
+    """
+    logs = sorted(glob.glob(os.path.join(results_dir, 'simulation-*.jsonl')))
+    if len(logs) == 0:
+        print "No simulated searches found in %s" % results_dir
+        return
+    curves = dict((path, convergence(path)) for path in logs)
+    curves = dict((path, curve) for path, curve in curves.items() if len(curve) > 0)
+    horizon = min(curve[-1]['gpu_hours'] for curve in curves.values())
+    checkpoints = [horizon * (k + 1) / float(points) for k in range(points)]
+
+    print "%-40s" % 'search (settings)' + ''.join('%12s' % ('%.2f GPU-h' % c) for c in checkpoints)
+    for path in sorted(curves):
+        settings = None
+        if os.path.exists(os.path.splitext(path)[0] + '.json'):
+            with open(os.path.splitext(path)[0] + '.json', 'r') as f:
+                settings = json.load(f)['settings']
+        row = []
+        for checkpoint in checkpoints:
+            reached = [p['best'] for p in curves[path] if p['gpu_hours'] <= checkpoint + 1e-9]
+            row.append(reached[-1] if len(reached) > 0 else None)
+        print "%-40s" % os.path.basename(path) + ''.join('%12s' % ('%.3f' % v if v is not None else '-') for v in row)
+        if settings is not None:
+            print "    %s" % ', '.join('%s=%s' % (k, settings[k]) for k in sorted(settings))
+
+
+# Spearmint entry point (copied as mainrun.py with --simulate)
+def main(job_id, params):
+    return simulate_trial(params)[0]
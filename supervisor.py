@@ -0,0 +1,121 @@
+import cPickle, imp
+import os, sys, signal
+import subprocess, tempfile, time
+
+SUPERVISOR_DIR = '../tmp'  # task/result files, relative to the Spearmint working dir
+
+
+def group_rss(pgid):
+    """
+        Resident memory (MB) of all the processes of a process group (the
+    trial, its power sampler, ...); None where /proc is not available.
+    """
+    if not os.path.isdir('/proc'):
+        return None
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    total = 0
+    for pid in os.listdir('/proc'):
+        if not pid.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % pid, 'r') as f:
+                fields = f.read().rsplit(')', 1)[1].split()  # (the command name may contain spaces)
+        except (IOError, OSError, IndexError):
+            continue  # exited meanwhile
+        if int(fields[2]) == pgid:
+            total += int(fields[21]) * page_size
+    return total / 2.0 ** 20
+
+
+def kill_group(process, grace=5.0):
+    """
+        Terminate the process group of a supervised trial (SIGTERM, then
+    SIGKILL after `grace` seconds) and reap the trial process; its orphaned
+    children are reaped by init.
+    """
+    for sig in [signal.SIGTERM, signal.SIGKILL]:
+        try:
+            os.killpg(process.pid, sig)
+        except OSError:
+            break  # no process left in the group
+        deadline = time.time() + grace
+        while process.poll() is None and time.time() < deadline:
+            time.sleep(0.1)
+    process.wait()
+
+
+class TrialSupervisor(object):
+    """
+        Run each trial in a fresh child process (its own process group) and
+    enforce a wall-clock (s) and a memory (MB, resident memory of the whole
+    group) budget: when one is exceeded, or if the child dies, the group is
+    killed and the trial is reported as failed instead of stalling the
+    search.
+    """
+
+    def __init__(self, wall_clock=None, memory=None, poll_interval=1.0):
+        self.wall_clock = wall_clock
+        self.memory = memory
+        self.poll_interval = poll_interval
+
+    def run(self, task, module, threads=None):
+        """
+            Evaluate task = (params, epochs, hw_metrics) in a supervised child.
+
+        :param module: path of the trial module (hyperpower.py, or its copy mainrun.py for Spearmint),
+                       its evaluate_trial is run by the child
+        :param threads: TF threads of the child (as limited in the calling worker)
+        :return: (status, result, hw_metrics, start), status is 'done', 'timeout', 'memory' or 'crashed'
+                 (result and hw_metrics are None unless 'done'), start is the time the child was started
+        """
+        fd, task_file = tempfile.mkstemp(prefix='trial-', suffix='.pkl', dir=SUPERVISOR_DIR)
+        with os.fdopen(fd, 'wb') as f:
+            cPickle.dump((task, os.path.splitext(os.path.abspath(module))[0] + '.py', threads), f, 2)
+        result_file = task_file[:-len('.pkl')] + '-result.pkl'
+
+        start = time.time()
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__).replace('.pyc', '.py'),
+                                    task_file, result_file], preexec_fn=os.setsid)
+        status = None
+        try:
+            while process.poll() is None:
+                time.sleep(self.poll_interval)
+                if self.wall_clock is not None and time.time() - start > self.wall_clock:
+                    status = 'timeout'
+                elif self.memory is not None and (group_rss(process.pid) or 0.0) > self.memory:
+                    status = 'memory'
+                if status is not None:
+                    print "Trial over its %s budget after %.0f s, killing it" % \
+                          ('wall-clock' if status == 'timeout' else 'memory', time.time() - start)
+                    break
+        finally:
+            kill_group(process)  # (also the power sampler, when the trial ended but left it behind)
+
+        try:
+            if status is None and os.path.exists(result_file):
+                with open(result_file, 'rb') as f:
+                    result, hw_metrics = cPickle.load(f)
+                return 'done', result, hw_metrics, start
+            return status or 'crashed', None, None, start
+        finally:
+            for path in [task_file, result_file]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+# child entry point: evaluate the trial, store its result
+if __name__ == '__main__':
+    task_file, result_file = sys.argv[1:3]
+    with open(task_file, 'rb') as f:
+        (params, epochs, hw_metrics), module, threads = cPickle.load(f)
+    if threads is not None:
+        from executor import limit_threads
+        limit_threads(threads)  # (the CPU affinity is inherited)
+    # the module that launched the trial (not necessarily importable as 'hyperpower', e.g., Spearmint's mainrun.py)
+    sys.path.insert(0, os.path.dirname(module))
+    trial_module = imp.load_source(os.path.splitext(os.path.basename(module))[0], module)
+    hw_metrics = dict(hw_metrics or {})
+    result = trial_module.evaluate_trial(params, epochs, hw_metrics)
+    with open(result_file + '.tmp', 'wb') as f:
+        cPickle.dump((result, hw_metrics), f, 2)
+    os.rename(result_file + '.tmp', result_file)
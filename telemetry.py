@@ -0,0 +1,134 @@
+import numpy as np
+import json, os
+import resource, time
+from contextlib import contextmanager
+
+TELEMETRY_FILE = '../telemetry.jsonl'  # relative to the Spearmint working dir (i.e., in the experiment dir)
+
+
+class TrialTelemetry(object):
+    """
+        Phase timings (and other facts) of one trial, appended as one JSON
+    record to the experiment's telemetry log when the trial ends. With
+    path=None nothing is written.
+    """
+
+    def __init__(self, path=TELEMETRY_FILE, search=None):
+        self.path = path
+        self.record = {'search': search, 'pid': os.getpid(), 'start': time.time(), 'phases': []}
+        self._peak_reset = reset_peak_rss() if path is not None else False  # (not for the placeholder)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start, time.time() - start)
+
+    def add_phase(self, name, start, duration):
+        self.record['phases'].append({'name': name, 'start': start, 'duration': duration})
+
+    def set(self, **kwargs):
+        self.record.update(kwargs)
+
+    def write(self):
+        if self.path is None:
+            return
+        self.record['end'] = time.time()
+        # peak of this trial (of the whole process lifetime where the peak cannot be reset, e.g., not on Linux)
+        peak = peak_rss() if self._peak_reset else None
+        self.record['peak_rss_mb'] = peak if peak is not None else \
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.record) + '\n')
+
+
+def reset_peak_rss():
+    """
+        Reset the peak resident memory (VmHWM) of the process to its current
+    resident memory, so that long-lived processes (daemon, pool and queue
+    workers) report the peak of each trial. False if not supported.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def peak_rss():
+    """
+        Peak resident memory (MB) of the process since the last reset, None if /proc is not available.
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    return None
+
+
+def load_records(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def is_violation(record):
+    """
+        True if the trial did not satisfy its constraint (NaN objective or negative slack).
+    """
+    result = record.get('result', None)
+    if not isinstance(result, dict):
+        return False
+    return any(v is None or np.isnan(v) for v in result.values()) or \
+        record.get('constraint') in result and result[record['constraint']] < 0
+
+
+def report(path, search=None):
+    """
+        Print the per-phase time breakdown, the trials/hour and the
+    constraint-violation rate of the trials in the telemetry log (of the
+    given search, by default of the latest one).
+    """
+    records = load_records(path)
+    if len(records) == 0:
+        print "No telemetry found at %s" % path
+        return
+    if search is None:
+        search = records[-1]['search']
+    records = [r for r in records if r['search'] == search]
+
+    trials = len(records)
+    failed = len([r for r in records if 'result' not in r or 'failure' in r])
+    wall_clock = max(r['end'] for r in records) - min(r['start'] for r in records)
+    trial_time = sum(r['end'] - r['start'] for r in records)
+    print "Search %s: %d trials (%d failed) in %.1f h, %.2f trials/hour" % \
+          (search, trials, failed, wall_clock / 3600.0, trials / max(wall_clock / 3600.0, 1e-9))
+    failures = {}
+    for r in records:
+        if 'failure' in r:
+            reason = r['failure'] if r['failure'] in ['timeout', 'memory', 'crashed'] else 'error'
+            failures[reason] = failures.get(reason, 0) + 1
+    if len(failures) > 0:
+        print "Failed trials: %s" % ', '.join('%d %s' % (n, reason) for reason, n in sorted(failures.items()))
+    print "Constraint violations: %.1f%%" % (100.0 * len([r for r in records if is_violation(r)]) / trials)
+    print "Peak RSS: %.0f MB (max over trials)" % max(r['peak_rss_mb'] for r in records)
+
+    phases = {}
+    for r in records:
+        for p in r['phases']:
+            phases.setdefault(p['name'], []).append(p['duration'])
+    print "%-16s %8s %12s %10s %8s" % ('phase', 'count', 'total (s)', 'mean (s)', 'share')
+    for name, durations in sorted(phases.items(), key=lambda item: -sum(item[1])):
+        if name == 'epoch':
+            continue  # already accounted for in 'train'
+        print "%-16s %8d %12.1f %10.3f %7.1f%%" % (name, len(durations), sum(durations), np.mean(durations),
+                                                  100.0 * sum(durations) / trial_time)
+    if 'epoch' in phases:
+        print "Training epochs: %d, %.3f s per epoch" % (len(phases['epoch']), np.mean(phases['epoch']))
@@ -0,0 +1,130 @@
+import numpy as np
+import hashlib, json, os
+import time
+from net_compiler import plain_value
+from hw_cache import measurement_setup
+from cost_model import TRAIN_METRICS
+
+TRIALS_FILE = '../results/trials.jsonl'  # relative to the Spearmint working dir (kept across searches)
+TEMPLATE_FILE = '../tmp/keras_net_template.py'
+
+
+def template_hash(path=TEMPLATE_FILE):
+    with open(path, 'r') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def result_from_metrics(metrics, hyperpowerparams):
+    """
+        The result keras_run would return for a trial with the given metrics
+    under the current objective/constraint (value); None if a needed metric
+    is missing.
+    """
+    optimize = hyperpowerparams['optimize']
+    if hyperpowerparams['exec_mode'] == 'unconstrained':
+        return metrics.get('error', None)
+    if hyperpowerparams['exec_mode'] == 'pareto':
+        if any(metrics.get(m, None) is None for m in hyperpowerparams['objectives']):
+            return None
+        return dict((m, metrics[m]) for m in hyperpowerparams['objectives'])
+
+    constraint = hyperpowerparams['constraint']
+    constraint_val = float(hyperpowerparams['constraint_val'])
+    if optimize == 'error':
+        if metrics.get(constraint, None) is None:
+            return None
+        if metrics[constraint] >= constraint_val:
+            return {optimize: np.NaN, constraint: constraint_val - metrics[constraint]}
+        if metrics.get('error', None) is None:
+            return None
+        return {optimize: metrics['error'], constraint: constraint_val - metrics[constraint]}
+
+    if metrics.get(optimize, None) is None or metrics.get('error', None) is None:
+        return None
+    return {optimize: metrics[optimize], constraint: constraint_val - metrics['error']}
+
+
+def failed_result(hyperpowerparams):
+    """
+        Result of a trial that could not be evaluated: maximum error, unknown
+    HW objective, constraint violated.
+    """
+    if hyperpowerparams['exec_mode'] == 'unconstrained':
+        return 100.0
+    if hyperpowerparams['exec_mode'] == 'pareto':
+        return dict((m, 100.0 if m == 'error' else np.NaN) for m in hyperpowerparams['objectives'])
+    optimize, constraint = hyperpowerparams['optimize'], hyperpowerparams['constraint']
+    constraint_val = float(hyperpowerparams['constraint_val'])
+    if optimize == 'error':
+        return {optimize: np.NaN, constraint: -abs(constraint_val)}
+    return {optimize: np.NaN, constraint: constraint_val - 100.0}
+
+
+class TrialStore(object):
+    """
+        Persistent (JSON-lines, append-only) store of the evaluated trials of
+    the experiment: suggested params, measured metrics, training epochs and
+    network template hash. Trials of previous searches that are compatible
+    with the current one are reused instead of being evaluated again.
+    """
+
+    def __init__(self, path=TRIALS_FILE):
+        self.path = path
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def add(self, params, metrics, epochs, template, search=None, early_stopped=False, duration=None, curve=None,
+            setup=None, budget=None):
+        """
+            Append a trial: its suggested params, measured metrics, wall time
+        (s), validation accuracy per epoch (if trained), the measurement
+        setup of its HW metrics (see hw_cache.measurement_setup) and the
+        budget (epochs) its training cost was extrapolated to.
+        """
+        record = {'params': params, 'metrics': metrics, 'epochs': epochs, 'template_hash': template,
+                  'search': search, 'early_stopped': early_stopped, 'time': time.time(),
+                  'duration': duration, 'curve': curve, 'setup': setup, 'budget': budget}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def compatible(self, hyperpowerparams, template, names, epochs=None):
+        """
+            Past trials usable by the current search: same network template and
+        hyper-parameters, where the error is needed, the same number of
+        training epochs, where the training cost is needed, the same budget
+        it was extrapolated to and, where HW metrics are needed, the same
+        measurement setup (host, power backend, profiling batch). Returns
+        [(params, result)], result as from keras_run.
+        """
+        epochs = int(epochs or hyperpowerparams['epochs'])
+        budget = int(hyperpowerparams['epochs'])
+        setup = measurement_setup(hyperpowerparams)
+        trials = []
+        for record in self.records():
+            if record['template_hash'] != template or sorted(record['params'].keys()) != sorted(names):
+                continue
+            metrics = dict(record['metrics'])
+            if record['epochs'] != epochs:
+                metrics.pop('error', None)  # trained for a different budget
+            if record.get('budget', None) != budget:
+                for m in TRAIN_METRICS:
+                    metrics.pop(m, None)  # extrapolated to a different budget
+            if record.get('setup', None) != setup:
+                metrics = dict((m, v) for m, v in metrics.items() if m == 'error')  # measured elsewhere
+            result = result_from_metrics(metrics, hyperpowerparams)
+            if result is not None:
+                trials.append((record['params'], result))
+        return trials
+
+    def lookup(self, hyperpowerparams, template, params, epochs=None):
+        """
+            Result of a compatible past trial with exactly these params, or None.
+        """
+        for past_params, result in self.compatible(hyperpowerparams, template, params.keys(), epochs):
+            if all(plain_value(past_params[p]) == plain_value(params[p]) for p in params):
+                return result
+        return None